@@ -0,0 +1,657 @@
+#!/usr/bin/env python
+#
+# Batch engine for simulation replicates
+#----------------------------------------
+# Plays many independent replicates of variation 3 or 5 at once. Every
+# replicate is still built and exported by a regular CollaborationModel, but
+# the rounds in between are played on NumPy arrays with one row per replicate
+# (replicates x players), one encounter of every replicate at a time. Each
+# replicate keeps its own random number stream, so the results are the same
+# as running the replicates one at a time with CollaborationModel.run().
+#
+# It also exports variation 0, which only describes the starting allocations,
+# for any number of allocations at once without building any models (see
+# export_allocations()).
+#
+# For variation 3 it can also schedule the encounters differently: instead of
+# pairing players at random, every round looks at every pair at once and
+# makes the best team changes that don't get in each other's way (see
+# BatchModel.best_response_round()). Compare the two with
+#
+#   python batch.py
+#
+# Requires numpy (pip install numpy); everything else in the simulation
+# works without it.
+#
+
+from simulation import CollaborationModel, RunCounters, HIGH_VALUE_TIER, LOW_VALUE_TIER, pairs, export_columns
+from random import Random
+import argparse
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Variations the batch engine can play
+BATCH_VARIATIONS = (3, 5)
+
+# Ways to schedule the encounters: random pairs every round, like CollaborationModel.run(), or the best non-conflicting team changes every round (variation 3 only)
+SCHEDULERS = ('random', 'best_response')
+
+# Columns of BatchModel.outcomes, in the same order as RunCounters.outcomes
+ACCEPTED, NO_GAIN, REFUSED, HELD_OUT, TIE_BREAK = range(5)
+
+
+class BatchModel:
+    """Runs a batch of replicates of the same simulation side by side, with identical results to running a CollaborationModel for each of them.
+
+    Each replicate's model is built right after seeding the random module with its seed (just like the runner does), and the state of the random module is then copied into the replicate's own stream. The stream shuffles the players into pairs and breaks ties in exactly the order CollaborationModel.run() would, so every replicate makes the same decisions and ends in the same state. At the end, every change is replayed on the replicate's model, which exports the row as usual.
+
+    Within a replicate, encounters depend on each other, so they are played one after another; what's vectorized is the k-th encounter of every replicate. The batch engine is only faster than running the models one at a time with a good number of replicates (a few hundred) per batch.
+
+    Only the encounter outcome counters match CollaborationModel.run(); the `*_calls` columns only count the calls made while building and exporting the models.
+
+    With the 'best_response' scheduler, variation 3 no longer pairs players at random; see best_response_round(). The results then differ from CollaborationModel.run() by design, but the runs end by the same rules and the rows have the same columns.
+
+    Attributes:
+        models: A list of CollaborationModel objects, one per replicate
+        streams: A list of Random objects, each replicate's random number stream
+        resources: An array (replicates x players) of each player's resource id
+        bits: An array (replicates x players) of each player's resource bit
+        teams: An array (replicates x players) of each player's team index
+        values: An array (replicates x players x resources) of each player's objective values by resource (Player.value_by_resource)
+        team_counts: An array (replicates x teams x resources) of how many players on each team hold each resource
+        team_masks: An array (replicates x teams) of each team's resource mask
+        team_values: An array (replicates x teams x resources) of each team's objective values by resource (Team.value_by_resource)
+        holdings: An array (replicates x players x objectives per player) of the objective indices each player holds (variation 5 only)
+        objective_resources, objective_tiers, objective_values: Arrays (replicates x objectives) describing every replicate's objectives table
+        outcomes: An array (replicates x 5) counting how encounters ended, in the order of RunCounters.outcomes
+        events: A list of (replicates, players, teams or objectives, receivers) arrays, one per encounter step, of the team changes (variation 3) or trades (variation 5) to replay on the models
+        scheduler: How encounters are scheduled, one of SCHEDULERS (see the `scheduler` argument)
+        rounds: A list of how many rounds each replicate took, once run() is done
+
+    Raises:
+        A general exception if numpy isn't installed, the variation isn't one of BATCH_VARIATIONS, or the scheduler isn't one of SCHEDULERS (or is 'best_response' for a variation other than 3).
+    """
+    def __init__(self, seeds, num_players, num_resources, num_objs_per_player,
+        approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
+        value_high, value_low, variation, faux_pareto_rounds_without_merges,
+        community_motivation, csv_out, csv_header, player_store=False, stop_when_stable=True, scheduler='random', allocations=None):
+        if numpy is None:
+            raise Exception("The batch engine needs numpy. Install it with `pip install numpy` or turn off `use_batch_engine`.")
+        if variation not in BATCH_VARIATIONS:
+            raise Exception("The batch engine can only run variations {0}, not variation {1}".format(', '.join(str(v) for v in BATCH_VARIATIONS), variation))
+        if scheduler not in SCHEDULERS:
+            raise Exception("Unknown scheduler '{0}'; use one of {1}".format(scheduler, ', '.join(SCHEDULERS)))
+        if scheduler == 'best_response' and variation != 3:
+            raise Exception("The best response scheduler only works with variation 3, not variation {0}".format(variation))
+
+        self.num_players = num_players
+        self.num_resources = num_resources
+        self.variation = variation
+        self.faux_pareto_rounds_without_merges = faux_pareto_rounds_without_merges
+        self.community_motivation = community_motivation
+        self.stop_when_stable = stop_when_stable
+        self.scheduler = scheduler
+        self.rounds = []
+
+        # Build every replicate's model from its own seed (and allocation, if given), then carry on with a copy of the random module's state
+        if allocations is None:
+            allocations = [None] * len(seeds)
+        self.models = []
+        self.streams = []
+        for replicate_seed, allocation in zip(seeds, allocations):
+            random.seed(replicate_seed)
+            self.models.append(CollaborationModel(num_players, num_resources, num_objs_per_player,
+                approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
+                value_high, value_low, variation, faux_pareto_rounds_without_merges,
+                community_motivation, csv_out, csv_header, player_store=player_store, stop_when_stable=stop_when_stable, allocation=allocation))
+            stream = Random()
+            stream.setstate(random.getstate())
+            self.streams.append(stream)
+
+        # Copy the players, teams, and objectives into arrays
+        num_replicates = len(self.models)
+        players = [[model.players[i] for i in range(num_players)] for model in self.models]
+        self.resources = numpy.array([[player.resource for player in row] for row in players], dtype=numpy.int64)
+        self.bits = numpy.left_shift(1, self.resources)
+        self.teams = numpy.array([[player.team.index for player in row] for row in players], dtype=numpy.int64)
+        self.values = numpy.array([[list(player.value_by_resource) for player in row] for row in players], dtype=numpy.int64)
+
+        self.shifts = numpy.arange(num_resources, dtype=numpy.int64)
+        num_teams = max(len(model.teams) for model in self.models)
+        self.team_counts = numpy.zeros((num_replicates, num_teams, num_resources), dtype=numpy.int64)
+        self.team_values = numpy.zeros((num_replicates, num_teams, num_resources), dtype=numpy.int64)
+        for r, model in enumerate(self.models):
+            for team in model.teams:
+                for resource, count in team.resource_counts.items():
+                    self.team_counts[r, team.index, resource] = count
+                self.team_values[r, team.index] = team.value_by_resource
+        self.team_masks = self.masks(self.team_counts)
+
+        tables = [model.objs_table for model in self.models]
+        self.objective_resources = numpy.array([[objective.resource for objective in table] for table in tables], dtype=numpy.int64)
+        self.objective_tiers = numpy.array([[objective.tier for objective in table] for table in tables], dtype=numpy.int64)
+        self.objective_values = numpy.array([[objective.value for objective in table] for table in tables], dtype=numpy.int64)
+        if variation == 5:
+            self.holdings = numpy.array([[sorted(player.objectives.keys()) for player in row] for row in players], dtype=numpy.int64)
+        else:
+            self.holdings = None
+
+        self.outcomes = numpy.zeros((num_replicates, 5), dtype=numpy.int64)
+        self.events = []
+
+    def masks(self, counts):
+        """Returns the resource masks for an array of resource counts (... x resources)."""
+        return numpy.left_shift(counts > 0, self.shifts).sum(-1)
+
+    def masked_totals(self, values, masks):
+        """Returns the sums of the values (... x resources) of every resource in the masks (...), like masked_sum() for many players at once."""
+        return (values * (numpy.right_shift(masks[..., None], self.shifts) & 1)).sum(-1)
+
+    def run(self, run_numbers):
+        """Plays every replicate until it ends, by the same rules as CollaborationModel.run(), and exports each replicate's row.
+
+        Args:
+            run_numbers: A list of the run numbers (see CollaborationModel.run()), one per replicate
+        """
+        num_replicates = len(self.models)
+        encounters = numpy.zeros(num_replicates, dtype=numpy.int64)
+        merges = numpy.zeros(num_replicates, dtype=numpy.int64)
+        rounds = self.rounds = [0] * num_replicates
+        rounds_without_merges = [0] * num_replicates
+        cycle_lengths = [0] * num_replicates
+
+        # Capture pre-simulation data
+        before = [(str(model.community.total()), model.community.individualStats()) for model in self.models]
+
+        # In variation 3 team membership is the whole state, so remember the round each state was first seen in to catch cycles
+        if self.variation == 3:
+            seen_states = [{self.teams[r].tostring(): 0} for r in range(num_replicates)]
+
+        active = numpy.arange(num_replicates)
+        while active.size:
+            teams_before = self.teams[active].copy()
+            merges_this_round = numpy.zeros(num_replicates, dtype=numpy.int64)
+
+            if self.scheduler == 'best_response':
+                for r in active:
+                    round_encounters, merges_this_round[r] = self.best_response_round(r)
+                    encounters[r] += round_encounters
+
+            else:
+                # Pair the players up with each replicate's own stream, exactly like CollaborationModel.run()
+                pairs_a = numpy.empty((active.size, self.num_players), dtype=numpy.int64)
+                pairs_b = numpy.empty((active.size, self.num_players), dtype=numpy.int64)
+                for row, r in enumerate(active):
+                    players_list = range(self.num_players)
+                    self.streams[r].shuffle(players_list)
+                    pairs_of_players = list(pairs(players_list))
+                    self.streams[r].shuffle(pairs_of_players)
+                    pairs_a[row], pairs_b[row] = zip(*pairs_of_players)
+
+                for k in range(pairs_a.shape[1]):
+                    a = pairs_a[:, k]
+                    b = pairs_b[:, k]
+                    meet = self.teams[active, a] != self.teams[active, b]  # Players on the same team don't meet
+                    replicates = active[meet]
+                    encounters[replicates] += 1
+                    if self.variation == 3:
+                        merged = self.variation_3(replicates, a[meet], b[meet])
+                    else:
+                        merged = self.variation_5(replicates, a[meet], b[meet])
+                    merges_this_round[replicates] += merged
+
+            # End the replicates that are done, by the same rules as CollaborationModel.run()
+            still_active = []
+            for row, r in enumerate(active):
+                rounds[r] += 1
+                merges[r] += merges_this_round[r]
+                if self.variation == 3:  # Only count rounds where somebody changed teams
+                    changed = (self.teams[r] != teams_before[row]).any()
+                else:
+                    changed = merges_this_round[r] > 0
+
+                if not changed:
+                    rounds_without_merges[r] += 1
+                else:
+                    rounds_without_merges[r] = 0
+
+                if rounds_without_merges[r] == self.faux_pareto_rounds_without_merges:
+                    continue
+
+                if self.stop_when_stable and not changed and self.is_stable(r):
+                    continue
+
+                if self.variation == 3 and changed:
+                    state = self.teams[r].tostring()
+                    if state in seen_states[r]:
+                        cycle_lengths[r] = rounds[r] - seen_states[r][state]
+                        continue
+                    seen_states[r][state] = rounds[r]
+
+                still_active.append(r)
+            active = numpy.array(still_active, dtype=numpy.int64)
+
+        # Replay every change on the models, in order, and export them
+        for replicates, players, targets, receivers in self.events:
+            for r, player, target, receiver in zip(replicates, players, targets, receivers):
+                model = self.models[r]
+                if self.variation == 3:
+                    model.players[player].joinTeam(model.teams[target])
+                else:
+                    model.players[player].giveObjective(target, model.players[receiver], traded_objectives_list=model.traded_objectives)
+
+        for r, model in enumerate(self.models):
+            for column, name in enumerate(model.counters.outcomes):
+                setattr(model.counters, name, getattr(model.counters, name) + int(self.outcomes[r, column]))
+            before_total, individual_statistics_before = before[r]
+            model.export(run_numbers[r], before_total, individual_statistics_before, int(encounters[r]), int(merges[r]), cycle_lengths[r])
+
+    def join(self, replicates, players, teams):
+        """Moves players (one per replicate) to new teams, updating the team arrays and logging the moves for the replay. A player can join their own team, which changes nothing but is replayed all the same."""
+        if not replicates.size:
+            return
+        old_teams = self.teams[replicates, players]
+        resources = self.resources[replicates, players]
+        self.team_counts[replicates, old_teams, resources] -= 1
+        self.team_counts[replicates, teams, resources] += 1
+        self.team_values[replicates, old_teams] -= self.values[replicates, players]
+        self.team_values[replicates, teams] += self.values[replicates, players]
+        self.team_masks[replicates, old_teams] = self.masks(self.team_counts[replicates, old_teams])
+        self.team_masks[replicates, teams] = self.masks(self.team_counts[replicates, teams])
+        self.teams[replicates, players] = teams
+        self.events.append((replicates, players, teams, players))
+
+    def variation_3(self, replicates, a, b):
+        """Plays one encounter of variation 3 in each replicate, between player a and player b (on different teams). Returns an array of 1 for every replicate where the encounter counts as a merge, otherwise 0."""
+        team_a = self.teams[replicates, a]
+        team_b = self.teams[replicates, b]
+        mask_a = self.team_masks[replicates, team_a]
+        mask_b = self.team_masks[replicates, team_b]
+        bit_a = self.bits[replicates, a]
+        bit_b = self.bits[replicates, b]
+        values_a = self.values[replicates, a]
+        values_b = self.values[replicates, b]
+
+        a_current = self.masked_totals(values_a, mask_a)
+        b_current = self.masked_totals(values_b, mask_b)
+        a_delta_if_move = self.masked_totals(values_a, mask_b | bit_a) - a_current
+        a_delta_if_stay = self.masked_totals(values_a, mask_a | bit_b) - a_current
+        b_delta_if_move = self.masked_totals(values_b, mask_a | bit_b) - b_current
+        b_delta_if_stay = self.masked_totals(values_b, mask_b | bit_a) - b_current
+
+        movers = numpy.full(replicates.size, -1, dtype=numpy.int64)  # The player who changes teams in each replicate (-1 for nobody)
+        destinations = numpy.zeros(replicates.size, dtype=numpy.int64)
+        merged = numpy.zeros(replicates.size, dtype=numpy.int64)
+        outcomes = numpy.full(replicates.size, NO_GAIN, dtype=numpy.int64)
+
+        if self.community_motivation is True:
+            # Team A's other members gain if B's resource is new to the team (see Team.gainIfAdded()); team B already has it
+            resource_b = self.resources[replicates, b]
+            a_other_deltas = numpy.where(mask_a & bit_b, 0, self.team_values[replicates, team_a, resource_b] - values_a[numpy.arange(replicates.size), resource_b])
+            community_delta_a_to_b = a_delta_if_move + b_delta_if_stay
+            community_delta_b_to_a = a_delta_if_stay + b_delta_if_move + a_other_deltas
+
+            a_to_b = (community_delta_a_to_b > 0) & (community_delta_a_to_b > community_delta_b_to_a)
+            b_to_a = (community_delta_b_to_a > 0) & (community_delta_b_to_a > community_delta_a_to_b)
+            tied = (community_delta_a_to_b > 0) & (community_delta_a_to_b == community_delta_b_to_a)
+
+            for i in numpy.flatnonzero(tied):  # Break ties with the replicate's own stream, like choice(["move", "stay"])
+                if self.streams[replicates[i]].choice(["move", "stay"]) == "stay":
+                    b_to_a[i] = True
+                else:
+                    a_to_b[i] = True
+
+            movers[a_to_b] = a[a_to_b]
+            destinations[a_to_b] = team_b[a_to_b]
+            movers[b_to_a] = b[b_to_a]
+            destinations[b_to_a] = team_a[b_to_a]
+            merged[a_to_b | b_to_a] = 1
+            outcomes[a_to_b | b_to_a] = ACCEPTED
+            outcomes[tied] = TIE_BREAK
+
+        else:
+            no_gain = (a_delta_if_stay <= 0) & (a_delta_if_move <= 0)
+            a_moves = ~no_gain & (a_delta_if_move >= 0) & (a_delta_if_move > a_delta_if_stay)  # move(a, b, ...)
+            a_invites = ~no_gain & ~a_moves & (a_delta_if_stay >= 0) & (a_delta_if_stay > a_delta_if_move)  # invite(a, b, ...)
+            a_tied = ~no_gain & ~a_moves & ~a_invites & (a_delta_if_stay == a_delta_if_move) & (a_delta_if_move > 0)
+
+            # B answers A's request like move() and invite() do
+            move_accepted = ((b_delta_if_stay > 0) & (b_delta_if_stay > b_delta_if_move)) | ((b_delta_if_stay == b_delta_if_move) & (b_delta_if_stay > 0))
+            move_held_out = ~move_accepted & (b_delta_if_move > 0) & (b_delta_if_move > b_delta_if_stay)
+            invite_accepted = ((b_delta_if_move >= 0) & (b_delta_if_move > b_delta_if_stay)) | ((b_delta_if_move == b_delta_if_stay) & (b_delta_if_move > 0))
+            invite_held_out = ~invite_accepted & (b_delta_if_stay >= 0) & (b_delta_if_stay > b_delta_if_move)
+
+            # If A doesn't mind either way, B asks A instead; A always accepts, since both options are equally good for A
+            b_moves = a_tied & (b_delta_if_move >= 0) & (b_delta_if_move > b_delta_if_stay)
+            b_invites = a_tied & ~b_moves & (b_delta_if_stay >= 0) & (b_delta_if_stay > b_delta_if_move)
+            b_tied = a_tied & ~b_moves & ~b_invites & (b_delta_if_stay == b_delta_if_move) & (b_delta_if_move > 0)
+            b_refuses = a_tied & ~b_moves & ~b_invites & ~b_tied
+
+            for i in numpy.flatnonzero(b_tied):  # Break ties with the replicate's own stream, like choice([self.move, self.invite])
+                if self.streams[replicates[i]].choice(["move", "invite"]) == "move":
+                    b_moves[i] = True
+                else:
+                    b_invites[i] = True
+
+            # Moves change teams; accepted invitations leave everyone where they are (the invitee joins their own team)
+            a_moved = a_moves & move_accepted
+            a_invited = a_invites & invite_accepted
+            movers[a_moved] = a[a_moved]
+            destinations[a_moved] = team_b[a_moved]
+            movers[a_invited] = b[a_invited]
+            destinations[a_invited] = team_b[a_invited]
+            movers[b_moves] = b[b_moves]
+            destinations[b_moves] = team_a[b_moves]
+            movers[b_invites] = a[b_invites]
+            destinations[b_invites] = team_a[b_invites]
+            merged[a_moved | a_invited | b_moves | b_invites] = 1
+
+            outcomes[a_moves] = numpy.where(move_accepted, ACCEPTED, numpy.where(move_held_out, HELD_OUT, REFUSED))[a_moves]
+            outcomes[a_invites] = numpy.where(invite_accepted, ACCEPTED, numpy.where(invite_held_out, HELD_OUT, REFUSED))[a_invites]
+            outcomes[b_moves | b_invites] = ACCEPTED
+            outcomes[b_tied] = TIE_BREAK
+            outcomes[b_refuses] = REFUSED
+
+        numpy.add.at(self.outcomes, (replicates, outcomes), 1)
+        moved = movers >= 0
+        self.join(replicates[moved], movers[moved], destinations[moved])
+        return merged
+
+    def best_given_objectives(self, replicates, holdings, own_resources, other_resources):
+        """Returns the objective each player would give away in variation 5, exactly like Player.best_given_objective(player.resource_bit, other_resource).
+
+        Args:
+            replicates: An array (...) of the players' replicates
+            holdings: An array (... x objectives per player) of the objective indices the players hold
+            own_resources: An array (...) of the players' resources
+            other_resources: An array (...) of the other players' resources
+
+        Returns an array (...) of objective indices. Like the original, a match of objective 0 doesn't count as a match, since 0 is falsy.
+        """
+        rows = replicates[..., None]
+        resources = self.objective_resources[rows, holdings]
+        low = self.objective_tiers[rows, holdings] == LOW_VALUE_TIER
+        good = resources == own_resources[..., None]
+        match = resources == other_resources[..., None]
+        none = self.objective_resources.shape[1]  # Larger than every objective index
+
+        def lowest(group):
+            return numpy.where(group, holdings, none).min(-1)
+
+        worthless_low, worthless_high, good_low, good_high = ~good & low, ~good & ~low, good & low, good & ~low
+
+        # Try to match the other player's resource: worthless_low -> worthless_high -> good_low
+        best = numpy.full(own_resources.shape, -1, dtype=numpy.int64)
+        for group in (worthless_low, worthless_high, good_low):
+            found = lowest(group & match)
+            best = numpy.where((best <= 0) & (found < none), found, best)
+
+        # Otherwise give away the lowest objective of the first group that has one: worthless_low -> worthless_high -> good_low -> good_high
+        fallback = lowest(worthless_low)
+        for group in (worthless_high, good_low, good_high):
+            fallback = numpy.where(fallback < none, fallback, lowest(group))
+        return numpy.where(best <= 0, fallback, best)
+
+    def trade_deltas(self, replicates, holder_resources, dropped, given):
+        """Returns how much each player's total changes by giving away the `dropped` objective and getting the `given` one, exactly like Player.currentTotal(objective_to_drop=dropped, given_objective=given, giver=...) on a team of one. As in the original, the given objective only counts if neither index is 0."""
+        dropped_value = numpy.where(self.objective_resources[replicates, dropped] == holder_resources, self.objective_values[replicates, dropped], 0)
+        given_value = numpy.where(self.objective_resources[replicates, given] == holder_resources, self.objective_values[replicates, given], 0)
+        return numpy.where((dropped > 0) & (given > 0), given_value, 0) - dropped_value
+
+    def trades(self, a_delta, b_delta):
+        """Returns which trades go ahead, by community or personal motivation."""
+        if self.community_motivation is True:
+            return a_delta + b_delta > 0
+        return (a_delta > 0) & (b_delta > 0)
+
+    def variation_5(self, replicates, a, b):
+        """Plays one encounter of variation 5 in each replicate, between player a and player b. Returns an array of 1 for every replicate where the players traded, otherwise 0."""
+        resource_a = self.resources[replicates, a]
+        resource_b = self.resources[replicates, b]
+        a_best_to_give = self.best_given_objectives(replicates, self.holdings[replicates, a], resource_a, resource_b)
+        b_best_to_give = self.best_given_objectives(replicates, self.holdings[replicates, b], resource_b, resource_a)
+
+        a_delta_if_trade = self.trade_deltas(replicates, resource_a, a_best_to_give, b_best_to_give)
+        b_delta_if_trade = self.trade_deltas(replicates, resource_b, b_best_to_give, a_best_to_give)
+        traded = self.trades(a_delta_if_trade, b_delta_if_trade)
+
+        outcomes = numpy.full(replicates.size, NO_GAIN, dtype=numpy.int64)
+        if self.community_motivation is not True:
+            outcomes[a_delta_if_trade > 0] = REFUSED
+        outcomes[traded] = ACCEPTED
+        numpy.add.at(self.outcomes, (replicates, outcomes), 1)
+
+        # Swap the objectives
+        replicates, a, b = replicates[traded], a[traded], b[traded]
+        a_gives, b_gives = a_best_to_give[traded], b_best_to_give[traded]
+        if replicates.size:
+            for giver, receiver, objective in [(a, b, a_gives), (b, a, b_gives)]:
+                resources = self.objective_resources[replicates, objective]
+                values = self.objective_values[replicates, objective]
+                self.values[replicates, giver, resources] -= values
+                self.values[replicates, receiver, resources] += values
+            a_slots = (self.holdings[replicates, a] == a_gives[:, None]).argmax(-1)
+            b_slots = (self.holdings[replicates, b] == b_gives[:, None]).argmax(-1)
+            self.holdings[replicates, a, a_slots] = b_gives
+            self.holdings[replicates, b, b_slots] = a_gives
+            self.events.append((replicates, a, a_gives, b))
+            self.events.append((replicates, b, b_gives, a))
+        return traded.astype(numpy.int64)
+
+    def is_stable(self, r):
+        """Returns true if no pair of players on different teams in replicate `r` could change anything, like CollaborationModel.is_stable(), by checking every pair at once."""
+        if self.variation == 5:
+            teams = self.teams[r]
+            different = teams[:, None] != teams[None, :]
+
+            # Every player's best objective to give to a player with each resource
+            holdings = numpy.repeat(self.holdings[r][:, None, :], self.num_resources, axis=1)
+            own = numpy.repeat(self.resources[r][:, None], self.num_resources, axis=1)
+            other = numpy.broadcast_to(numpy.arange(self.num_resources), own.shape)
+            replicate = numpy.full(own.shape, r, dtype=numpy.int64)
+            best = self.best_given_objectives(replicate, holdings, own, other)  # players x resources
+
+            resources = self.resources[r]
+            a_gives = best[:, resources]  # a_gives[a, b]: what A would give B
+            b_gives = a_gives.T
+            replicate = numpy.full(a_gives.shape, r, dtype=numpy.int64)
+            a_delta = self.trade_deltas(replicate, resources[:, None], a_gives, b_gives)
+            b_delta = self.trade_deltas(replicate, resources[None, :], b_gives, a_gives)
+            return not (different & self.trades(a_delta, b_delta)).any()
+
+        return not (self.joins(r) > 0).any()
+
+    def pair_deltas(self, r):
+        """Returns what every pair of players in replicate `r` would gain from each outcome of a variation 3 encounter, as matrices (players x players): a_move[a, b] is A's gain from moving to B's team, a_stay[a, b] A's gain from B joining A's team, and, with community motivation, a_other[a, b] the gain of the rest of A's team from B joining it (None otherwise)."""
+        teams = self.teams[r]
+        bits = self.bits[r]
+        values = self.values[r]
+        player_masks = self.team_masks[r, teams]
+        current = self.masked_totals(values, player_masks)
+        a_move = self.masked_totals(values[:, None, :], player_masks[None, :] | bits[:, None]) - current[:, None]
+        a_stay = self.masked_totals(values[:, None, :], player_masks[:, None] | bits[None, :]) - current[:, None]
+
+        a_other = None
+        if self.community_motivation is True:
+            resources = self.resources[r]
+            a_other = numpy.where(player_masks[:, None] & bits[None, :], 0, self.team_values[r][teams][:, resources] - values[:, resources])
+        return a_move, a_stay, a_other
+
+    def joins(self, r):
+        """Returns the team changes that an encounter between each pair of players in replicate `r` would make in variation 3, whoever starts it, as a matrix (players x players) of gains: joins[m, h] is the gain from player m joining player h's team, or 0 if no encounter between them ends that way.
+
+        The gain is the community delta with community motivation and the sum of both players' personal deltas otherwise. Ties that variation_3() breaks at random go to the option that changes teams.
+        """
+        teams = self.teams[r]
+        a_move, a_stay, a_other = self.pair_deltas(r)
+        b_move = a_move.T
+        b_stay = a_stay.T
+
+        if self.community_motivation is True:
+            community_delta_a_to_b = a_move + b_stay
+            community_delta_b_to_a = a_stay + b_move + a_other
+            a_to_b = (community_delta_a_to_b > 0) & (community_delta_a_to_b >= community_delta_b_to_a)
+            b_to_a = (community_delta_b_to_a > 0) & (community_delta_b_to_a > community_delta_a_to_b)
+            a_joins = numpy.where(a_to_b, community_delta_a_to_b, 0)
+            b_joins = numpy.where(b_to_a, community_delta_b_to_a, 0)
+        else:
+            # Only moves change anything; accepted invitations leave everyone where they are
+            no_gain = (a_stay <= 0) & (a_move <= 0)
+            a_moves = ~no_gain & (a_move >= 0) & (a_move > a_stay)
+            a_invites = ~no_gain & ~a_moves & (a_stay >= 0) & (a_stay > a_move)
+            a_tied = ~no_gain & ~a_moves & ~a_invites & (a_stay == a_move) & (a_move > 0)
+            move_accepted = ((b_stay > 0) & (b_stay > b_move)) | ((b_stay == b_move) & (b_stay > 0))
+            b_moves = (b_move >= 0) & (b_move > b_stay)
+            b_tied = ~b_moves & (b_stay == b_move) & (b_move > 0)
+            a_joins = numpy.where(a_moves & move_accepted, a_move + b_stay, 0)
+            b_joins = numpy.where(a_tied & (b_moves | b_tied), b_move + a_stay, 0)
+
+        # b_joins[a, b] is B joining A's team, so it belongs at [b, a]
+        joins = numpy.maximum(a_joins, b_joins.T)
+        joins[teams[:, None] == teams[None, :]] = 0  # Players on the same team don't meet
+        return joins
+
+    def best_response_round(self, r):
+        """Plays one round of variation 3 in replicate `r` with the best response scheduler. Returns the number of encounters and the number of team changes.
+
+        Every pair of players on different teams meets at once (each pair is one encounter), and joins() works out what each encounter would change. The changes are then made greedily, biggest gain first, skipping any that touches a team that another change this round already left or joined, so every change is still worth exactly what it was worth at the start of the round. Encounters that made a change count as accepted, those whose change was skipped as held out, and the rest as no gain.
+        """
+        teams = self.teams[r]
+        joins = self.joins(r)
+        movers, hosts = numpy.nonzero(joins)
+        order = numpy.argsort(-joins[movers, hosts], kind='mergesort')
+
+        used_teams = set()
+        players = []
+        destinations = []
+        for i in order:
+            source, destination = teams[movers[i]], teams[hosts[i]]
+            if source in used_teams or destination in used_teams:
+                continue
+            used_teams.update((source, destination))
+            players.append(movers[i])
+            destinations.append(destination)
+
+        different = teams[:, None] != teams[None, :]
+        encounters = int(different.sum()) // 2
+        changes = int(numpy.triu((joins > 0) | (joins.T > 0)).sum())
+        self.outcomes[r, ACCEPTED] += len(players)
+        self.outcomes[r, HELD_OUT] += changes - len(players)
+        self.outcomes[r, NO_GAIN] += encounters - changes
+
+        self.join(numpy.full(len(players), r, dtype=numpy.int64), numpy.array(players, dtype=numpy.int64), numpy.array(destinations, dtype=numpy.int64))
+        return encounters, len(players)
+
+
+def export_allocations(allocations, run_numbers, num_players, num_resources, num_objs_per_player,
+    value_high, value_low, community_motivation, csv_out, csv_header):
+    """Writes the variation 0 rows for a batch of allocations, the same rows CollaborationModel.run() writes for variation 0, without building any players, teams, or communities.
+
+    Every player starts out on a team of their own, so a player's total is the value of the objectives that match their own resource, and nothing else is needed from a model. The statistics of every allocation are worked out at once on arrays (allocations x players x objectives per player). The `*_calls` columns are 0, since none of the counted methods are called.
+
+    Args:
+        allocations: A list of Allocation named tuples (see allocate()), all made with the settings below
+        run_numbers: A list of the run numbers (see CollaborationModel.run()), one per allocation
+        csv_out: A csv.writer (or anything with a writerow() method) for the rows
+        csv_header: Boolean; if true, the column names are written first when a run number is 0
+
+    Raises:
+        A general exception if numpy isn't installed.
+    """
+    if numpy is None:
+        raise Exception("The batch engine needs numpy. Install it with `pip install numpy` or turn off `use_batch_engine`.")
+
+    resource_pool = allocations[0].resource_pool
+    table = allocations[0].objective_pool.table
+    num_allocations = len(allocations)
+    num_objs = len(table)
+
+    # Objectives are counted by (resource, tier), at key resource * 2 + tier - 1
+    table_keys = numpy.array([objective.resource * 2 + objective.tier - HIGH_VALUE_TIER for objective in table], dtype=numpy.int64)
+    table_resources = numpy.array([objective.resource for objective in table], dtype=numpy.int64)
+    table_values = numpy.array([objective.value for objective in table], dtype=numpy.int64)
+    objective_counts = numpy.bincount(table_keys, minlength=num_resources * 2)
+
+    # Players are dealt resources in resource order and objectives in order of the shuffled lists, just like CollaborationModel does
+    slot_resources = numpy.repeat([resource for resource, quantity in sorted(resource_pool.pool.items())],
+        [quantity for resource, quantity in sorted(resource_pool.pool.items())])
+    players = numpy.array([allocation.players_list for allocation in allocations], dtype=numpy.int64)
+    held = numpy.array([allocation.objs_index for allocation in allocations], dtype=numpy.int64).reshape(num_allocations, num_players, num_objs_per_player)
+    fulfilled = table_resources[held] == slot_resources[None, :, None]
+
+    # Every player's total, in player order (the order of Community.individualStats())
+    scores = numpy.empty((num_allocations, num_players), dtype=numpy.int64)
+    scores[numpy.arange(num_allocations)[:, None], players] = (table_values[held] * fulfilled).sum(-1)
+    totals = scores.sum(1)
+    middle = num_players / 2
+    if num_players % 2:  # median() doesn't sort, so it's the middle player's total
+        medians = scores[:, middle]
+    else:
+        medians = (scores[:, middle - 1] + scores[:, middle]) / 2.0
+    means = totals / float(num_players)
+
+    rows = numpy.arange(num_allocations)[:, None, None] * (num_resources * 2) + table_keys[held]
+    fulfilled_counts = numpy.bincount(rows[fulfilled], minlength=num_allocations * num_resources * 2).reshape(num_allocations, num_resources * 2)
+    objs_fulfilled = fulfilled_counts.sum(1)
+
+    potential = int(table_values.sum())
+    team_size_median = 1 if num_players % 2 else 1.0
+    counter_values = [count for name, count in RunCounters().columns()]
+    for r, run_number in enumerate(run_numbers):
+        total = int(totals[r])
+        individual = [int(scores[r].min()), int(scores[r].max()), float(means[r]), medians[r].item()]
+        objs = int(objs_fulfilled[r])
+
+        # The row's values, in the order of export_columns(), like CollaborationModel.export()
+        row = [run_number + 1, 0, num_players, 1 if community_motivation else 0, 0.0001, 0, 0 / 0.0001, 0,
+            num_players, 1, 1, 1.0, team_size_median]
+        row.extend(individual + individual)
+        row.extend([individual[2] - individual[2], individual[3] - individual[3],
+            str(total), total, potential, potential - total, total / float(potential),
+            num_resources, num_objs, objs, num_objs - objs, 0, 0, objs / float(num_objs), (num_objs - objs) / float(num_objs)])
+
+        for resource, frequency in resource_pool.resources_list:
+            for tier, value in ((HIGH_VALUE_TIER, value_high), (LOW_VALUE_TIER, value_low)):
+                key = resource * 2 + tier - HIGH_VALUE_TIER
+                count = int(objective_counts[key])
+                fulfilled_count = int(fulfilled_counts[r, key])
+                row.extend([value, count, 1 if frequency == "high_freq" else 0, 0, 0, fulfilled_count, fulfilled_count / float(count), count - fulfilled_count])
+
+        row.extend(counter_values)
+
+        if run_number == 0 and csv_header: csv_out.writerow(export_columns(resource_pool.resources_list))
+        csv_out.writerow(row)
+
+class NullWriter:
+    """Stands in for a csv.writer and throws the rows away."""
+    def writerow(self, row):
+        pass
+
+
+def compare_schedulers(num_players, num_replicates, seed):
+    """Runs the same replicates of variation 3 with each scheduler and prints the mean rounds, encounters, and team changes per run, and the mean social value at the end."""
+    print "{0:<12} {1:<15} {2:>8} {3:>11} {4:>9} {5:>13}".format('Motivation', 'Scheduler', 'Rounds', 'Encounters', 'Switches', 'Social value')
+    for community_motivation in [False, True]:
+        for scheduler in SCHEDULERS:
+            batch = BatchModel([seed + i for i in range(num_replicates)], num_players, 4, 5, 3, 3, 20, 10, 3, 25,
+                community_motivation, NullWriter(), False, scheduler=scheduler)
+            batch.run(range(num_replicates))
+            encounters = sum(model.counters.accepted + model.counters.no_gain + model.counters.refused + model.counters.held_out + model.counters.tie_break for model in batch.models)
+            switches = sum(model.counters.accepted + model.counters.tie_break for model in batch.models)
+            social_value = sum(model.community.total() for model in batch.models)
+            print "{0:<12} {1:<15} {2:>8.1f} {3:>11.1f} {4:>9.1f} {5:>13.1f}".format('community' if community_motivation else 'personal', scheduler,
+                sum(batch.rounds) / float(num_replicates), encounters / float(num_replicates), switches / float(num_replicates), social_value / float(num_replicates))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare random pairing with the best response scheduler in variation 3.")
+    parser.add_argument('--players', type=int, default=16, help="players per run (default: %(default)s)")
+    parser.add_argument('--replicates', type=int, default=100, help="runs per scheduler and motivation (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=12345, help="seed of the first run; the others use the next seeds (default: %(default)s)")
+    args = parser.parse_args()
+    compare_schedulers(args.players, args.replicates, args.seed)
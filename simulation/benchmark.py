@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+#
+# Benchmarks for the simulation
+#-------------------------------
+# Times the hot paths (player totals, team resources, picking objectives,
+# the community total, and one encounter of each variation) and full runs
+# with 16, 128, and 1024 players. Everything uses fixed seeds, so the same
+# work is timed every time.
+#
+# Usage:
+#   python benchmark.py           # Run and compare against the saved baseline
+#   python benchmark.py --save    # Run and save the results as the new baseline
+#
+from simulation import *
+from timeit import default_timer
+import argparse
+import subprocess
+import resource
+import random
+import json
+import sys
+import os
+
+#-----------------------------------------------------------
+# Set up the benchmarks
+#-----------------------------------------------------------
+seed = 12345
+micro_players = 128  # Size of the simulation used for the hot path benchmarks
+micro_repeats = 5  # Each hot path is timed this many times and the fastest time is kept
+encounters_per_variation = 2000  # Pairs of players that meet in the variation benchmarks (only pairs on different teams count as encounters)
+full_run_sizes = [16, 128, 1024]
+full_runs_per_size = {16: 50, 128: 5, 1024: 1}  # Complete simulations timed for each size, with seeds seed, seed + 1, ...
+full_run_variations = [1, 3, 5]
+baseline_file = 'benchmark_baseline.json'
+tolerance = 0.2  # Flag anything more than 20% slower (or bigger) than the baseline
+
+
+#------------------------------
+# Benchmark procedure
+#------------------------------
+class NullWriter:
+  """Stands in for a csv.writer and throws the rows away."""
+  def writerow(self, row):
+    pass
+
+
+def build_model(num_players, variation, community_motivation=False, player_store=False, model_seed=seed):
+  random.seed(model_seed)
+  return CollaborationModel(num_players, 4, 5, 3, 3, 20, 10, variation, 25,
+    community_motivation, NullWriter(), False, player_store=player_store)
+
+def peak_memory_kb():
+  """Returns the peak resident memory of this process so far, in kilobytes."""
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak / 1024 if sys.platform == 'darwin' else peak  # macOS reports bytes, Linux kilobytes
+
+def calls_per_second(function, calls, setup=None):
+  """Returns the best rate of `calls` calls per second over `micro_repeats` runs of function(). If given, setup() is run before each timing and its result is passed to function(). If `calls` is None, function() returns how many calls it made."""
+  best = 0.0
+  for repeat in range(micro_repeats):
+    argument = setup() if setup else None
+    start = default_timer()
+    made = function(argument)
+    elapsed = default_timer() - start
+    best = max(best, (made if calls is None else calls) / elapsed)
+  return best
+
+def encounter_pairs(model):
+  """Returns `encounters_per_variation` pairs of players, drawn round by round the same way CollaborationModel.run() pairs them up."""
+  pairing = random.Random(seed)
+  encounters = []
+  while len(encounters) < encounters_per_variation:
+    players_list = range(len(model.players))
+    pairing.shuffle(players_list)
+    pairs_of_players = list(pairs(players_list))
+    pairing.shuffle(pairs_of_players)
+    encounters.extend((model.players[a], model.players[b]) for a, b in pairs_of_players)
+  return encounters[:encounters_per_variation]
+
+
+def hot_path_benchmarks():
+  """Times the methods that the variations call for every encounter. Returns a dictionary of {'rate': calls per second} results."""
+  results = {}
+  model = build_model(micro_players, 3)
+  players = model.players.values()
+  teams = model.teams
+  loops = 50
+
+  # Every player paired with the next player over, for the what-if totals
+  partners = [(player, players[(i + 1) % len(players)]) for i, player in enumerate(players)]
+  drops = [(player, other.team, min(player.objectives.keys())) for player, other in partners]
+  pools = [(player, player.team.resource_mask | other.resource_bit) for player, other in partners]
+
+  def current_total(argument):
+    for loop in xrange(loops):
+      for player in players:
+        player.currentTotal()
+  results['Player.currentTotal'] = {'rate': calls_per_second(current_total, loops * len(players))}
+
+  def current_total_what_if(argument):
+    for loop in xrange(loops):
+      for player, team, objective in drops:
+        player.currentTotal(team, objective_to_drop=objective)
+  results['Player.currentTotal (what-if)'] = {'rate': calls_per_second(current_total_what_if, loops * len(drops))}
+
+  def team_resources(argument):
+    for loop in xrange(loops):
+      for team in teams:
+        team.resources()
+  results['Team.resources'] = {'rate': calls_per_second(team_resources, loops * len(teams))}
+
+  def best_given_objective(argument):
+    for loop in xrange(loops):
+      for player, pool in pools:
+        player.best_given_objective(pool)
+  results['Player.best_given_objective'] = {'rate': calls_per_second(best_given_objective, loops * len(pools))}
+
+  def community_total(argument):
+    for loop in xrange(loops * len(players)):
+      model.community.total()
+  results['Community.total'] = {'rate': calls_per_second(community_total, loops * len(players))}
+
+  # One encounter of each variation, starting from the same allocation and the same pairs every time
+  for variation in [1, 2, 3, 4, 5]:
+    for community_motivation in [False, True]:
+      def setup():
+        model = build_model(micro_players, variation, community_motivation)
+        random.seed(seed)  # For the variations' tie breaks
+        return model, encounter_pairs(model)
+
+      def encounter(argument):
+        model, encounters = argument
+        decide = model.variations[model.variation]
+        count = 0
+        for player_a, player_b in encounters:
+          if player_a.team != player_b.team:  # Players on the same team don't meet, just like in CollaborationModel.run()
+            decide(player_a, player_b)
+            count += 1
+        return count
+
+      name = 'variation_{0} encounter ({1})'.format(variation, 'community' if community_motivation else 'personal')
+      results[name] = {'rate': calls_per_second(encounter, None, setup)}
+
+  return results
+
+
+def full_run(num_players, variation, community_motivation):
+  """Runs `full_runs_per_size` complete simulations. Returns runs per second and the peak memory of the process."""
+  runs = full_runs_per_size.get(num_players, 1)
+  start = default_timer()
+  for i in xrange(runs):
+    build_model(num_players, variation, community_motivation, model_seed=seed + i).run(i)
+  return {'rate': runs / (default_timer() - start), 'peak_kb': peak_memory_kb()}
+
+def full_run_benchmarks():
+  """Times full runs, each size and variation in its own process so the peak memory belongs to that run alone."""
+  results = {}
+  for num_players in full_run_sizes:
+    for variation in full_run_variations:
+      for community_motivation in [False, True]:
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--full-run',
+          str(num_players), str(variation), '1' if community_motivation else '0'])
+        name = 'run N={0} variation_{1} ({2})'.format(num_players, variation, 'community' if community_motivation else 'personal')
+        results[name] = json.loads(output)
+  return results
+
+def memory_benchmarks():
+  """Returns the memory per player ({'bytes': ...}) of a PlayerStore, including its StoredPlayer views, for each full run size."""
+  results = {}
+  for num_players in full_run_sizes:
+    model = build_model(num_players, 0, player_store=True)
+    results['PlayerStore per player N={0}'.format(num_players)] = {'bytes': model.store.bytesPerPlayer(model.players.values())}
+  return results
+
+
+def compare(results, baseline):
+  """Prints every result next to the baseline, flagging anything slower (or bigger) by more than `tolerance`. Returns the number of regressions."""
+  regressions = 0
+  print "{0:<45} {1:>14} {2:>14} {3:>9}".format('Benchmark', 'Result', 'Baseline', 'Change')
+  for name in sorted(results):
+    old = baseline.get(name, {})
+    for metric in ['rate', 'bytes', 'peak_kb']:
+      if metric not in results[name]:
+        continue
+      label = name if metric != 'peak_kb' else '  peak memory (KB)'
+      value = results[name][metric]
+      old_value = old.get(metric)
+
+      if not old_value:
+        print "{0:<45} {1:>14.2f} {2:>14} {3:>9}".format(label, value, '-', '')
+        continue
+
+      # Rates are better when higher, sizes when lower
+      change = value / float(old_value) - 1
+      if metric == 'rate':
+        flag = '  SLOWER' if change < -tolerance else ''
+      else:
+        flag = '  BIGGER' if change > tolerance else ''
+      regressions += 1 if flag else 0
+      print "{0:<45} {1:>14.2f} {2:>14.2f} {3:>+8.0%}{4}".format(label, value, old_value, change, flag)
+  return regressions
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description="Benchmark the simulation's hot paths and full runs.")
+  parser.add_argument('--save', action='store_true', help="save the results as the new baseline")
+  parser.add_argument('--baseline', default=baseline_file, help="baseline file to compare against (default: %(default)s)")
+  parser.add_argument('--full-run', nargs=3, type=int, metavar=('PLAYERS', 'VARIATION', 'COMMUNITY'), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  # A single full run benchmark, started by full_run_benchmarks() in a new process
+  if args.full_run:
+    num_players, variation, community_motivation = args.full_run
+    print json.dumps(full_run(num_players, variation, bool(community_motivation)))
+    sys.exit(0)
+
+  results = {}
+  results.update(hot_path_benchmarks())  # Calls per second
+  results.update(memory_benchmarks())  # Bytes per player
+  results.update(full_run_benchmarks())  # Runs per second and peak memory
+
+  baseline = {}
+  if os.path.exists(args.baseline):
+    with open(args.baseline, 'rb') as baseline_json:
+      baseline = json.load(baseline_json)
+
+  regressions = compare(results, baseline)
+
+  if args.save:
+    with open(args.baseline, 'wb') as baseline_json:
+      json.dump(results, baseline_json, sort_keys=True, indent=2)
+    print "\nSaved the results to {0}".format(args.baseline)
+  elif regressions:
+    print "\n{0} regression(s) compared to {1}".format(regressions, args.baseline)
+    sys.exit(1)
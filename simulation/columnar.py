@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Columnar (Parquet) output for simulation results
+#--------------------------------------------------
+# The wide CSV stores every value as a quoted string. For big sweeps this
+# writes the same rows to a typed, compressed Parquet file as well, which R
+# can load with arrow::read_parquet() much faster than read.csv().
+#
+# Requires pyarrow (pip install pyarrow); everything else in the simulation
+# works without it.
+#
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+# Columns that hold ratios, means, or medians. Everything else is a count or an ID and is stored as an integer.
+FLOAT_COLUMNS = set(['encounters', 'switch_ratio', 'team_size_mean', 'team_size_median',
+    'indiv_total_mean_before', 'indiv_total_median_before', 'indiv_total_mean_after', 'indiv_total_median_after',
+    'indiv_delta_mean', 'indiv_delta_median', 'percent_social_value_met', 'objs_fulfilled_ratio', 'objs_unfulfilled_ratio'])
+FLOAT_SUFFIXES = ('_pct_fulfilled',)
+
+
+def column_is_float(name):
+    """Returns true if a CSV column is stored as a float instead of an integer."""
+    return name in FLOAT_COLUMNS or name.endswith(FLOAT_SUFFIXES)
+
+
+class ColumnarWriter:
+    """Writes result rows to a Parquet file with a fixed, typed schema.
+
+    The schema is built once from the CSV header, so it follows the resource list (a1_count, a1_pct_fulfilled, b1_count, ...). Rows are buffered and appended as compressed row groups of `row_group_size` rows; the file is only complete once close() is called.
+
+    Attributes:
+        filename: The path of the Parquet file
+        names: A list of column names, in CSV order
+        floats: A list of booleans, true for the columns stored as floats
+        schema: The pyarrow schema of the file
+        row_group_size: The number of rows buffered before they are written as one row group
+        rows: The buffered rows that haven't been written yet
+
+    Raises:
+        A general exception if pyarrow isn't installed.
+    """
+    def __init__(self, filename, header, row_group_size=10000, compression='snappy'):
+        if pyarrow is None:
+            raise Exception("Columnar output needs pyarrow. Install it with `pip install pyarrow` or turn off `columnar_output_file`.")
+
+        self.filename = filename
+        self.names = list(header)
+        self.floats = [column_is_float(name) for name in self.names]
+        self.schema = pyarrow.schema([pyarrow.field(name, pyarrow.float64() if is_float else pyarrow.int64())
+            for name, is_float in zip(self.names, self.floats)])
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema, compression=compression)
+
+    def writerow(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def flush(self):
+        """Converts the buffered rows into typed columns and appends them to the file as one row group."""
+        if not self.rows:
+            return
+
+        arrays = []
+        for column, is_float, field in zip(zip(*self.rows), self.floats, self.schema):
+            # Some values (like social_value_before) arrive as strings, so cast everything to the column's type
+            if is_float:
+                values = [float(value) for value in column]
+            else:
+                values = [int(value) for value in column]
+            arrays.append(pyarrow.array(values, type=field.type))
+
+        self.writer.write_table(pyarrow.Table.from_arrays(arrays, names=self.names))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
@@ -1,12 +1,21 @@
 #!/usr/bin/env python
 from simulation import *
-from multiprocessing import Pool
+from columnar import ColumnarWriter
+from summary import SummaryAggregator
+from batch import BatchModel, BATCH_VARIATIONS, export_allocations
+from multiprocessing import Pool, Queue
+from Queue import Empty, Full
+from timeit import default_timer
+import threading
+import tempfile
+import shutil
+import sys
 import random
-import fileinput
+import hashlib
 import os
 
 #-----------------------------------------------------------
-# Set up the simulation 
+# Set up the simulation
 # (change these variables to create different simulations)
 #-----------------------------------------------------------
 seed = 12345
@@ -17,61 +26,367 @@ value_high = 20
 value_low = 10
 approximate_high_low_resource_ratio = 3
 approximate_high_low_objective_ratio = 3
-faux_pareto_rounds_without_merges = 25
+faux_pareto_rounds_without_merges = 25  # Cap on empty rounds in a row, for runs that never settle
+stop_when_stable = True  # End each run as soon as no pair of players can collaborate any more; False only uses the cap above
 times_to_run_simulation = 500
 variations = [0, 1, 3, 5]  # Must be 0, 1, 2, 3, 4, or 5. 0 exports initial allocation data; 1-5 actually run simulation algorithms.
+common_random_numbers = True  # Start replicate i of every variation and motivation from the same allocation of resources and objectives, so differences between variations aren't down to the allocations; False draws a new allocation for each run
+use_player_store = False  # Keep players in flat arrays (PlayerStore) to save memory with very large populations
+use_batch_engine = False  # Play each task's replicates of variations 3 and 5 side by side on NumPy arrays (BatchModel, needs numpy), and export variation 0 without building models (export_allocations()); same results, faster with a larger replicates_per_task
+scheduler = 'random'  # 'random' or 'best_response'. 'best_response' makes the best non-conflicting team changes each round instead of pairing players at random (variation 3 with use_batch_engine only; other variations still pair at random)
+
+# Parallel processing
+processes = None  # Number of worker processes; None uses every core
+replicates_per_task = 25  # Each task runs this many replicates of one variation and motivation. Results don't depend on this or on `processes`.
+write_batch_size = 1000  # Maximum number of rows the writer collects from the result queue before writing and flushing them
+result_queue_size = 10000  # Maximum number of finished rows waiting for the writer; when it's full, workers wait. The writer itself only holds one batch (rows that finish out of turn are spilled to disk), so a slow disk can't fill up memory with more than this plus `write_batch_size` rows (0 for no limit)
+fsync_interval = 10.0  # Seconds between forcing the CSV onto the disk (os.fsync), so a crash of the whole machine loses at most this much; None only flushes it to the operating system after every batch
+output_file = '../Output/all_variations.csv'  # None skips the full CSV (e.g. when only the summary is needed). Rows are written in task order; rows of tasks that finish ahead of their turn wait in <output_file>.tasks until then
+columnar_output_file = None  # Also write typed, compressed results here, e.g. '../Output/all_variations.parquet' (needs pyarrow)
+summary_output_file = '../Output/summary.csv'  # Running mean and sd of the Table 4 columns for each variation and motivation; None turns it off
+timings_output_file = None  # Mean seconds per run spent in each phase of the simulation (see PHASES) for each variation and motivation, e.g. '../Output/timings.csv'; None turns timing off
 
 
 #------------------------------
 # Actual simulation procedure
 #------------------------------
-def run_variation(variation):
-  # Seed has to be set here because of multiprocessing
-  random.seed(seed)
-  # On variation 0, include headers and make sure the file is opened with 'wb' to create a new file. 
-  # Use 'awb' after that to append to the new file
-  if variation == 0:
-    csv_header = True
-  else:
-    csv_header = False
-
-  # Initialize
-  csv_file = open('variation_{0}.csv'.format(variation), 'wb')
-  csv_out = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL)
-
-  community_motivation = False  # Personal motivation
-  for i in xrange(times_to_run_simulation):
-    # simulation.test_run()
-    simulation = CollaborationModel(num_players, num_resources, num_objs_per_player, 
+def replicate_seed(variation, community_motivation, replicate, master_seed=None):
+  """Derive an independent random seed for a single replicate from the master `seed` (or `master_seed`, if given).
+
+  Every replicate gets its own stream, so the results are identical no matter how the replicates are split into tasks or how many workers run them.
+  """
+  if master_seed is None:
+    master_seed = seed
+  key = '{0}:{1}:{2}:{3}'.format(master_seed, variation, 1 if community_motivation else 0, replicate)
+  return int(hashlib.sha1(key).hexdigest()[:16], 16)
+
+def allocation_seed(replicate, master_seed=None):
+  """Derive the seed of a replicate's allocation from the master `seed` (or `master_seed`, if given). Unlike replicate_seed(), it doesn't depend on the variation or motivation, so with `common_random_numbers` they all share the allocation."""
+  if master_seed is None:
+    master_seed = seed
+  key = '{0}:allocation:{1}'.format(master_seed, replicate)
+  return int(hashlib.sha1(key).hexdigest()[:16], 16)
+
+def replicate_allocation(replicate):
+  """Returns the shared allocation for a replicate (see allocate()), or None if `common_random_numbers` is off and every run draws its own. Each one is only made once and kept in `shared_allocations`."""
+  if not common_random_numbers:
+    return None
+  if replicate not in shared_allocations:
+    shared_allocations[replicate] = allocate(num_players, num_resources, num_objs_per_player,
       approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
-      value_high, value_low, variation, faux_pareto_rounds_without_merges, 
-      community_motivation, csv_out, csv_header)
-    simulation.run(i)
+      value_high, value_low, allocation_seed(replicate))
+  return shared_allocations[replicate]
 
-  community_motivation = True  # Community motivation
-  for i in xrange(times_to_run_simulation):
-    simulation = CollaborationModel(num_players, num_resources, num_objs_per_player, 
+# Allocations made by replicate_allocation(), by replicate (at most `times_to_run_simulation` of them)
+shared_allocations = {}
+
+def build_tasks():
+  """Split the simulation into (variation, community_motivation, first replicate, last replicate + 1) tasks."""
+  tasks = []
+  for variation in variations:
+    for community_motivation in [False, True]:  # Personal motivation, then community motivation
+      for start in xrange(0, times_to_run_simulation, replicates_per_task):
+        tasks.append((variation, community_motivation, start, min(start + replicates_per_task, times_to_run_simulation)))
+  return tasks
+
+class QueueWriter:
+  """Stands in for a csv.writer in CollaborationModel.run(), sending every finished row to the result queue instead of a file, tagged with the index of the task it belongs to. close() tells the writer the task is complete. If the queue is full, it waits for the writer to catch up."""
+  def __init__(self, queue, task_index):
+    self.queue = queue
+    self.task_index = task_index
+
+  def writerow(self, row):
+    self.queue.put((self.task_index, row))
+
+  def close(self):
+    self.queue.put((self.task_index, None))
+
+
+class RowCollector(list):
+  """Stands in for a csv.writer by keeping the rows in a list."""
+  def writerow(self, row):
+    self.append(row)
+
+
+class ResultWriter(threading.Thread):
+  """The single writer for all results. Rows from every worker arrive on one queue and are written in batches, flushing after each batch, so finished runs are on disk even if the simulation crashes.
+
+  Rows arrive as (task index, row) pairs in the order runs finish, but are written in task order, so the output is the same no matter how many workers there are or how the replicates are split into tasks. The rows of the earliest unfinished task go straight out. Rows of later tasks are spilled to a file for each task (<filename>.tasks/<task index>.csv, or a temporary folder with no `filename`), flushed along with the CSV, and copied into the output once every task before them is complete. So nothing waits in memory, and if the simulation crashes, the rows that finished ahead of their turn are in those files.
+
+  If `columnar` is given (a ColumnarWriter), every row is also passed to it, and it is closed once the last row is written. If `summary` is given (a SummaryAggregator), every row is added to it; it is up to the caller to write it out. With no `filename`, no CSV is written at all.
+
+  With `fsync_interval`, the CSV and spill files are also forced onto the disk with os.fsync() after a batch whenever that many seconds have passed since the last time, and once more when the CSV is closed.
+
+  If writing fails (e.g. the disk is full), the thread stops and keeps the exception in `error` (from sys.exc_info()), so the main thread can stop the workers instead of letting them wait on a full queue forever.
+  """
+  def __init__(self, queue, filename, header, batch_size, columnar=None, summary=None, fsync_interval=None):
+    threading.Thread.__init__(self)
+    self.queue = queue
+    self.next_task = 0  # The earliest task that isn't complete yet
+    self.spills = {}  # Open (file, csv.writer) spill files of later tasks that are still running, by task index
+    self.complete = set()  # Later tasks that are already complete, with closed spill files
+    self.spill_dir = None  # Made the first time a task finishes rows ahead of its turn
+    self.filename = filename
+    self.header = header
+    self.batch_size = batch_size
+    self.columnar = columnar
+    self.summary = summary
+    self.fsync_interval = fsync_interval
+    self.error = None
+
+  def spill_file(self, task_index):
+    return os.path.join(self.spill_dir, '{0}.csv'.format(task_index))
+
+  def spill(self, task_index, row):
+    """Writes a row of a task whose turn hasn't come yet to its spill file."""
+    if task_index not in self.spills:
+      if self.spill_dir is None:
+        if self.filename:
+          self.spill_dir = self.filename + '.tasks'
+          if os.path.isdir(self.spill_dir):  # Left over from a run that crashed
+            shutil.rmtree(self.spill_dir)
+          os.makedirs(self.spill_dir)
+        else:
+          self.spill_dir = tempfile.mkdtemp()
+      spill_file = open(self.spill_file(task_index), 'wb')
+      self.spills[task_index] = (spill_file, csv.writer(spill_file, delimiter=',', quoting=csv.QUOTE_ALL))
+    self.spills[task_index][1].writerow(row)
+
+  def catch_up(self, task_index):
+    """Writes out everything a task spilled so far and removes its spill file."""
+    if task_index in self.spills:
+      self.spills.pop(task_index)[0].close()
+    if self.spill_dir is not None and os.path.exists(self.spill_file(task_index)):
+      with open(self.spill_file(task_index), 'rb') as spill_file:
+        for row in csv.reader(spill_file):
+          self.emit(row)
+      os.remove(self.spill_file(task_index))
+
+  def take(self, task_index, row):
+    """Handles a (task index, row) pair from the queue: writes the row if it's the task's turn, spills it otherwise. A row of None means the task is complete."""
+    if task_index != self.next_task:
+      if row is not None:
+        self.spill(task_index, row)
+      else:
+        if task_index in self.spills:
+          self.spills.pop(task_index)[0].close()
+        self.complete.add(task_index)
+    elif row is not None:
+      self.emit(row)
+    else:
+      # Move on to the next task, writing out everything it (and any complete tasks after it) already spilled; once a task that is still running has caught up, its rows go straight out
+      self.next_task += 1
+      while self.next_task in self.complete:
+        self.complete.remove(self.next_task)
+        self.catch_up(self.next_task)
+        self.next_task += 1
+      self.catch_up(self.next_task)
+
+  def emit(self, row):
+    if self.csv_out is not None:
+      self.csv_out.writerow(row)
+    if self.columnar is not None:
+      self.columnar.writerow(row)
+    if self.summary is not None:
+      self.summary.writerow(row)
+
+  def run(self):
+    try:
+      self.write_results()
+    except Exception:
+      self.error = sys.exc_info()
+
+  def write_results(self):
+    csv_file = self.csv_out = None
+    if self.filename:
+      csv_file = open(self.filename, 'wb')
+      self.csv_out = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL)
+      self.csv_out.writerow(self.header)
+      csv_file.flush()
+
+    try:
+      last_sync = default_timer()
+      finished = False
+      while not finished:
+        batch = [self.queue.get()]  # Wait for the next row
+
+        # Grab whatever else is already waiting, up to a full batch
+        while len(batch) < self.batch_size:
+          try:
+            batch.append(self.queue.get_nowait())
+          except Empty:
+            break
+
+        # None marks the end of the results
+        if None in batch:
+          batch = batch[:batch.index(None)]
+          finished = True
+        for task_index, row in batch:
+          self.take(task_index, row)
+        if finished:  # Only left over if a task failed; keep what the later tasks did finish
+          for task_index in sorted(set(self.spills) | self.complete):
+            self.catch_up(task_index)
+          if self.spill_dir is not None:
+            os.rmdir(self.spill_dir)
+
+        sync = self.fsync_interval is not None and default_timer() - last_sync >= self.fsync_interval
+        for spill_file, spill_out in self.spills.values():
+          spill_file.flush()
+          if sync:
+            os.fsync(spill_file.fileno())
+        if csv_file is not None:
+          csv_file.flush()
+          if sync:
+            os.fsync(csv_file.fileno())
+        if sync:
+          last_sync = default_timer()
+    finally:
+      if csv_file is not None:
+        if self.fsync_interval is not None:
+          csv_file.flush()
+          os.fsync(csv_file.fileno())
+        csv_file.close()
+
+    if self.columnar is not None:
+      self.columnar.close()
+
+
+def csv_header_row():
+  """Returns the CSV column names by exporting a single variation 0 model."""
+  rows = RowCollector()
+  simulation = CollaborationModel(num_players, num_resources, num_objs_per_player,
+    approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
+    value_high, value_low, 0, faux_pareto_rounds_without_merges,
+    False, rows, True, player_store=use_player_store, stop_when_stable=stop_when_stable)
+  simulation.run(0)
+  return rows[0]
+
+def init_worker(queue):
+  """Give each worker process the shared result queue."""
+  global result_queue
+  result_queue = queue
+
+def run_task(indexed_task):
+  """Runs every replicate in a (task index, task) pair from build_tasks(), sending the rows to the result queue. Returns the task's variation, motivation, and, if `timings_output_file` is set, the seconds its runs spent in each phase (otherwise None)."""
+  task_index, task = indexed_task
+  csv_out = QueueWriter(result_queue, task_index)
+  result = play_task(task, csv_out)
+  csv_out.close()
+  return result
+
+def play_task(task, csv_out):
+  """Runs every replicate in a task, writing the rows to `csv_out`. Returns the same as run_task()."""
+  variation, community_motivation, start, stop = task
+  phase_totals = dict.fromkeys(PHASES, 0.0) if timings_output_file else None
+
+  # The batch engine doesn't time phases, so timings always use the regular engine
+  if use_batch_engine and variation == 0 and phase_totals is None:
+    allocations = []
+    for i in xrange(start, stop):
+      allocation = replicate_allocation(i)
+      if allocation is None:  # Draw it from the replicate's seed, like CollaborationModel would
+        random.seed(replicate_seed(variation, community_motivation, i))
+        allocation = allocate(num_players, num_resources, num_objs_per_player,
+          approximate_high_low_resource_ratio, approximate_high_low_objective_ratio, value_high, value_low)
+      allocations.append(allocation)
+    export_allocations(allocations, [i + times_to_run_simulation if community_motivation else i for i in xrange(start, stop)],
+      num_players, num_resources, num_objs_per_player, value_high, value_low, community_motivation, csv_out, False)
+    return variation, community_motivation, stop - start, phase_totals
+
+  if use_batch_engine and variation in BATCH_VARIATIONS and phase_totals is None:
+    replicates = range(start, stop)
+    batch = BatchModel([replicate_seed(variation, community_motivation, i) for i in replicates],
+      num_players, num_resources, num_objs_per_player,
       approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
-      value_high, value_low, variation, faux_pareto_rounds_without_merges, 
-      community_motivation, csv_out, csv_header)
-    simulation.run(i + times_to_run_simulation)
+      value_high, value_low, variation, faux_pareto_rounds_without_merges,
+      community_motivation, csv_out, False, player_store=use_player_store, stop_when_stable=stop_when_stable,
+      scheduler=scheduler if variation == 3 else 'random', allocations=[replicate_allocation(i) for i in replicates])
+    batch.run([i + times_to_run_simulation if community_motivation else i for i in replicates])
+    return variation, community_motivation, stop - start, phase_totals
 
-  csv_file.close()
+  for i in xrange(start, stop):
+    # Seed has to be set here because of multiprocessing
+    random.seed(replicate_seed(variation, community_motivation, i))
+    simulation = CollaborationModel(num_players, num_resources, num_objs_per_player,
+      approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
+      value_high, value_low, variation, faux_pareto_rounds_without_merges,
+      community_motivation, csv_out, False, player_store=use_player_store, stop_when_stable=stop_when_stable,
+      timings=phase_totals is not None, allocation=replicate_allocation(i))
+    simulation.run(i + times_to_run_simulation if community_motivation else i)
 
-# Single core version
-# map(run_variation, variations)
+    if phase_totals is not None:
+      for phase in PHASES:
+        phase_totals[phase] += simulation.phase_times[phase]
+
+  return variation, community_motivation, stop - start, phase_totals
+
+def write_timings(filename, results):
+  """Writes the mean seconds per run spent in each phase, and in total, for each variation and motivation, from the results of run_task()."""
+  totals = {}
+  for variation, community_motivation, runs, phase_totals in results:
+    key = (variation, 1 if community_motivation else 0)
+    if key not in totals:
+      totals[key] = [0, dict.fromkeys(PHASES, 0.0)]
+    totals[key][0] += runs
+    for phase in PHASES:
+      totals[key][1][phase] += phase_totals[phase]
+
+  with open(filename, 'wb') as csv_file:
+    csv_out = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL)
+    csv_out.writerow(['variation', 'community_motivation', 'runs'] + ['{0}_seconds'.format(phase) for phase in PHASES] + ['total_seconds'])
+    for key in sorted(totals):
+      runs, phase_seconds = totals[key]
+      means = [phase_seconds[phase] / runs for phase in PHASES]
+      csv_out.writerow(list(key) + [runs] + means + [sum(means)])
+
+# Single core version: set `processes = 1`
 
 # Multiple core version! (65% performance boost!)
 # This line needed for Windows (see http://docs.python.org/2/library/multiprocessing.html#windows)
 if __name__ == '__main__':
-  pool = Pool() 
-  pool.map(run_variation, variations)
-  pool.close()
-  pool.join()
-
-  # Loop through the temporary csv files, combine them, and delete them
-  filenames = ['variation_{0}.csv'.format(variation) for variation in variations]
-  with open('../Output/all_variations.csv', 'w') as fout:
-      for line in fileinput.input(filenames):
-          fout.write(line)
-  [os.remove(fn) for fn in filenames]
+  tasks = build_tasks()
+
+  # Make the shared allocations up front, so the forked workers all read the same copy instead of each building their own
+  for i in xrange(times_to_run_simulation):
+    replicate_allocation(i)
+
+  # Start the single writer, which streams rows to the output file as the workers finish them
+  queue = Queue(result_queue_size)
+  header = csv_header_row()
+  columnar = ColumnarWriter(columnar_output_file, header) if columnar_output_file else None
+  summary = SummaryAggregator(header) if summary_output_file else None
+  writer = ResultWriter(queue, output_file, header, write_batch_size, columnar, summary, fsync_interval)
+  writer.start()
+
+  pool = Pool(processes, initializer=init_worker, initargs=(queue,))
+  pending = [pool.apply_async(run_task, (indexed_task,)) for indexed_task in enumerate(tasks)]  # Handed out one task at a time, so every core stays busy
+  try:
+    # Wait for every task, even after one fails, so none is stopped halfway through sending a row. If the writer stops, nobody reads the queue any more and the workers would wait on it forever once it's full, so stop waiting.
+    for result in pending:
+      while not result.ready() and writer.is_alive():
+        result.wait(1.0)
+  finally:
+    if writer.is_alive():
+      pool.close()
+    else:
+      pool.terminate()
+    pool.join()
+
+    # Tell the writer there are no more rows and wait for it, so an error isn't stuck behind a waiting writer
+    while writer.is_alive():
+      try:
+        queue.put(None, timeout=1.0)
+        break
+      except Full:  # The writer may have failed with the queue full
+        pass
+    writer.join()
+
+  if writer.error is not None:
+    raise writer.error[0], writer.error[1], writer.error[2]
+  results = [result.get() for result in pending]  # Raises the error of the first task that failed, if any
+
+  if summary is not None:
+    summary.write(summary_output_file)
+
+  if timings_output_file:
+    write_timings(timings_output_file, results)
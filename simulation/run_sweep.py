@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+from simulation import *
+from multiprocessing import Pool
+from itertools import product
+import run_simulation as defaults
+import hashlib
+import random
+import json
+import csv
+import os
+
+#-----------------------------------------------------------
+# Set up the sweep
+# (every combination of the values below is simulated; any
+# model setting left out uses its value from run_simulation.py)
+#-----------------------------------------------------------
+sweep = {
+  'num_players': [16, 32, 64],
+  'num_resources': [4],
+  'approximate_high_low_resource_ratio': [2, 3],
+  'approximate_high_low_objective_ratio': [3],
+}
+times_to_run_simulation = defaults.times_to_run_simulation
+variations = defaults.variations
+replicates_per_task = defaults.replicates_per_task  # Each cached block holds this many replicates of one configuration, variation, and motivation
+processes = defaults.processes
+
+cache_dir = '../Output/sweep_cache'  # Finished blocks are kept here; delete it to start over
+output_dir = '../Output/sweep'  # One CSV of results per configuration, plus configs.csv listing them
+cache_version = 2  # Bump this when the simulation changes in a way that changes results, so old blocks aren't reused (changes to the columns are caught on their own, since the header row is part of the hash)
+
+# Settings that go into every configuration (and its hash), in addition to the ones in `sweep`
+model_settings = ['seed', 'num_players', 'num_resources', 'num_objs_per_player', 'value_high', 'value_low',
+  'approximate_high_low_resource_ratio', 'approximate_high_low_objective_ratio',
+  'faux_pareto_rounds_without_merges', 'stop_when_stable', 'common_random_numbers']
+
+
+#------------------------------
+# Actual sweep procedure
+#------------------------------
+def build_configs():
+  """Returns a list of configuration dictionaries, one for each combination of the values in `sweep`."""
+  for name in sweep:
+    if name not in model_settings:
+      raise Exception("Can't sweep over `{0}`; it must be one of {1}".format(name, ', '.join(model_settings)))
+
+  names = sorted(sweep)
+  configs = []
+  for values in product(*[sweep[name] for name in names]):
+    config = dict((name, getattr(defaults, name)) for name in model_settings)
+    config.update(zip(names, values))
+    configs.append(config)
+  return configs
+
+def config_hash(config):
+  """Returns a short, stable hash of a configuration, used to name its cache folder and output file. Along with the settings, it covers `cache_version` and the configuration's header row, so blocks from an older version of the simulation are never mixed in."""
+  settings = json.dumps(config, sort_keys=True)
+  if settings not in config_hashes:
+    key = json.dumps([cache_version, header_row(config), config], sort_keys=True)
+    config_hashes[settings] = hashlib.sha1(key).hexdigest()[:12]
+  return config_hashes[settings]
+
+# Hashes made by config_hash(), keyed by the settings, since each one runs a model for the header row
+config_hashes = {}
+
+def cached_ranges(config, variation, community_motivation):
+  """Returns the sorted (first replicate, last replicate + 1) ranges already cached for a configuration, variation, and motivation, from the names of its block files."""
+  folder = os.path.join(cache_dir, config_hash(config))
+  prefix = '{0}_{1}_'.format(variation, 1 if community_motivation else 0)
+  ranges = []
+  if os.path.isdir(folder):
+    for name in os.listdir(folder):
+      if name.startswith(prefix) and name.endswith('.csv'):
+        start, stop = name[len(prefix):-len('.csv')].split('-')
+        ranges.append((int(start), int(stop)))
+  return sorted(ranges)
+
+def build_blocks(configs):
+  """Split the replicates that aren't cached yet into (configuration, variation, community_motivation, first replicate, last replicate + 1) blocks.
+
+  Blocks never cross a multiple of `replicates_per_task`, and any cached block is reused for the replicates it covers, whatever its range. So an interrupted sweep, or one extended to more replicates, only runs what is missing.
+  """
+  blocks = []
+  for config in configs:
+    for variation in variations:
+      for community_motivation in [False, True]:  # Personal motivation, then community motivation
+        cached = [False] * times_to_run_simulation
+        for start, stop in cached_ranges(config, variation, community_motivation):
+          for i in xrange(start, min(stop, times_to_run_simulation)):
+            cached[i] = True
+
+        start = None
+        for i in xrange(times_to_run_simulation + 1):
+          if start is not None and (i == times_to_run_simulation or cached[i] or i % replicates_per_task == 0):
+            blocks.append((config, variation, community_motivation, start, i))
+            start = None
+          if i < times_to_run_simulation and not cached[i] and start is None:
+            start = i
+  return blocks
+
+def block_file(block):
+  """Returns the cache file for a block: cache_dir/<config hash>/<variation>_<motivation>_<start>-<stop>.csv"""
+  config, variation, community_motivation, start, stop = block
+  return os.path.join(cache_dir, config_hash(config), '{0}_{1}_{2}-{3}.csv'.format(variation, 1 if community_motivation else 0, start, stop))
+
+def build_model(config, variation, community_motivation, csv_out, csv_header, allocation=None):
+  return CollaborationModel(config['num_players'], config['num_resources'], config['num_objs_per_player'],
+    config['approximate_high_low_resource_ratio'], config['approximate_high_low_objective_ratio'],
+    config['value_high'], config['value_low'], variation, config['faux_pareto_rounds_without_merges'],
+    community_motivation, csv_out, csv_header, player_store=defaults.use_player_store, stop_when_stable=config['stop_when_stable'],
+    allocation=allocation)
+
+def replicate_allocation(config, replicate):
+  """Returns the allocation a configuration's replicate shares across variations and motivations, or None if `common_random_numbers` is off for it (see run_simulation.replicate_allocation()). It is made again for every run rather than kept, so a long sweep doesn't hold on to the allocations of every configuration; allocate() still shares the pools."""
+  if not config['common_random_numbers']:
+    return None
+  return allocate(config['num_players'], config['num_resources'], config['num_objs_per_player'],
+    config['approximate_high_low_resource_ratio'], config['approximate_high_low_objective_ratio'],
+    config['value_high'], config['value_low'], defaults.allocation_seed(replicate, config['seed']))
+
+def header_row(config):
+  """Returns the CSV column names for a configuration by exporting a single variation 0 model."""
+  rows = defaults.RowCollector()
+  build_model(config, 0, False, rows, True).run(0)
+  return rows[0]
+
+def run_block(block):
+  """Runs every replicate in a block and caches the rows. The file is written under a temporary name and renamed when it's complete, so an interrupted block is simply run again.
+
+  The cached rows are numbered by replicate alone, since the `id` of a community motivation row depends on `times_to_run_simulation`; combine() gives them their final ids.
+  """
+  config, variation, community_motivation, start, stop = block
+  rows = defaults.RowCollector()
+  rows.writerow(header_row(config))
+
+  for i in xrange(start, stop):
+    random.seed(defaults.replicate_seed(variation, community_motivation, i, config['seed']))
+    build_model(config, variation, community_motivation, rows, False, replicate_allocation(config, i)).run(i)
+
+  filename = block_file(block)
+  with open(filename + '.tmp', 'wb') as csv_file:
+    csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL).writerows(rows)
+  os.rename(filename + '.tmp', filename)
+
+def combine(configs):
+  """Gathers the cached blocks into one CSV per configuration and writes configs.csv, which maps each file to its settings. Each replicate's row comes from the first cached block that covers it, and gets the same `id` as in run_simulation.py. Raises an exception if the blocks of a configuration don't all have the same columns."""
+  if not os.path.isdir(output_dir):
+    os.makedirs(output_dir)
+
+  with open(os.path.join(output_dir, 'configs.csv'), 'wb') as index_file:
+    index_out = csv.writer(index_file, delimiter=',', quoting=csv.QUOTE_ALL)
+    index_out.writerow(['config'] + model_settings)
+
+    for config in configs:
+      name = config_hash(config)
+      index_out.writerow([name] + [config[setting] for setting in model_settings])
+
+      with open(os.path.join(output_dir, name + '.csv'), 'wb') as csv_file:
+        csv_out = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL)
+        first_header = None
+        for variation in variations:
+          for community_motivation in [False, True]:
+            rows = [None] * times_to_run_simulation
+            for start, stop in cached_ranges(config, variation, community_motivation):
+              if start >= times_to_run_simulation or all(row is not None for row in rows[start:stop]):
+                continue
+              block = (config, variation, community_motivation, start, stop)
+              with open(block_file(block), 'rb') as block_csv:
+                block_rows = csv.reader(block_csv)
+                header = next(block_rows)
+                if first_header is None:
+                  csv_out.writerow(header)
+                  first_header = header
+                elif header != first_header:
+                  raise Exception("The columns of {0} don't match the rest of configuration {1}; delete {2} and run the sweep again".format(block_file(block), name, os.path.dirname(block_file(block))))
+                id_position = header.index('id')
+                for i, row in zip(xrange(start, min(stop, times_to_run_simulation)), block_rows):
+                  if rows[i] is None:
+                    row[id_position] = (i + times_to_run_simulation if community_motivation else i) + 1
+                    rows[i] = row
+
+            if None in rows:
+              raise Exception("Replicate {0} of variation {1} isn't cached for configuration {2}".format(rows.index(None), variation, name))
+            csv_out.writerows(rows)
+
+
+if __name__ == '__main__':
+  configs = build_configs()
+
+  for config in configs:
+    folder = os.path.join(cache_dir, config_hash(config))
+    if not os.path.isdir(folder):
+      os.makedirs(folder)
+    with open(os.path.join(folder, 'config.json'), 'wb') as config_file:
+      json.dump(config, config_file, sort_keys=True, indent=2)
+
+  # Only run the replicates that aren't cached yet, so an interrupted or extended sweep picks up where it left off
+  missing = build_blocks(configs)
+  print "{0} configurations, {1} blocks to run".format(len(configs), len(missing))
+
+  pool = Pool(processes)
+  for finished, result in enumerate(pool.imap_unordered(run_block, missing, chunksize=1)):
+    print "Finished block {0} of {1}".format(finished + 1, len(missing))
+  pool.close()
+  pool.join()
+
+  combine(configs)
@@ -9,11 +9,13 @@
 #
 
 # Load required libraries and functions
-from collections import Counter, namedtuple
+from collections import Counter, OrderedDict, namedtuple
 from itertools import islice
 from string import ascii_uppercase
-from random import shuffle, sample, seed, choice
-from copy import deepcopy
+from random import shuffle, sample, seed, choice, Random
+from array import array
+from sys import getsizeof
+from timeit import default_timer
 import csv
 
 
@@ -100,21 +102,45 @@ class CollaborationModel():
         community: A Community object
         resource_pool: A ResourcePool object
         objective_pool: An ObjectivePool object
-        objs_table: A list of dictionaries with each objective name and value, corresponding to ObjectivePool.table
+        objs_table: A list of Objective named tuples (resource id, value tier, value), corresponding to ObjectivePool.table
+        store: A PlayerStore object holding the players' data, or None if players are regular Player objects
         players: A dictionary of Player objects (uses a dictionary so that players can be indexed): e.g., {0: <__main__.Player instance at 0x106a895a8>, 1: <__main__.Player instance at 0x106a89e18>, ...}
         teams: A list of Team objects (uses a list because the teams don't need to be indexed): e.g., [<__main__.Team instance at 0x10be66d88>, <__main__.Team instance at 0x10be66dd0>, ...]
-        dropped_objectives: A list of lists to track dropped objectives: e.g., [['d2', 10], ['b1', 20], ['a1', 20]]. Objectives are no longer indexed because uniqueness doesn't matter.
+        dropped_objectives: A list of Objective named tuples to track dropped objectives: e.g., [Objective(resource=3, tier=2, value=10), Objective(resource=1, tier=1, value=20)]. Objectives are no longer indexed because uniqueness doesn't matter.
         traded_objectives: A list of lists to track dropped objectives. Objectives are no longer indexed because uniqueness doesn't matter and an objective can be traded multiple times.
+
+    Pass `check_social_total=True` to have the community check its running social total against a full recompute every time it is read (slow; for debugging only).
+
+    Pass `player_store=True` to keep the players in a struct-of-arrays PlayerStore (see StoredPlayer), which uses much less memory per player for very large populations.
+
+    By default a run ends as soon as no pair of players can collaborate or trade any more (see is_stable()); `faux_pareto_rounds_without_merges` is only a cap for runs that never settle. Pass `stop_when_stable=False` to only use the rounds-without-merges rule, which gives the same teams but more encounters that change nothing.
+
+    Pass an `allocation` (see allocate()) to start from a resource and objective allocation made beforehand instead of drawing a new one from the random module. Models built from the same allocation start out identical, which is how the runner gives every variation and motivation the same starting point for a replicate (common random numbers). The allocation is only read, so any number of models can share it.
+
+    Pass `timings=True` to time each part of the simulation (see PHASES): building the pools and players (`construction`), shuffling players into pairs (`pairing`), running the variation for each pair (`decisions`), checking is_stable() (`stability`), and gathering and writing the results (`export`). The seconds spent in each phase are kept in `phase_times`, which is None when timing is off.
+
+    Every exported row ends with counts of how the run's encounters ended (accepted, no gain, refused, held out for the other option, or settled by a random tie-break) and of how many times the most used methods were called. They're kept in `counters` (see RunCounters).
+
+    Variation 3 can cycle forever, with players hopping back and forth between teams. Since players only ever change teams in that variation, team membership is its whole state, so a variation 3 run also ends as soon as a round changes the teams back to how they were at the end of an earlier round (see Community.membership_hash). The number of rounds in the cycle is exported as `cycle_length` (0 if the run ended some other way). Rounds that leave everyone on the same team count as rounds without merges in variation 3, even if invitations were accepted.
     """
     def __init__(self, num_players, num_resources, num_objs_per_player, 
         approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
         value_high, value_low, variation, faux_pareto_rounds_without_merges, 
-        community_motivation, csv_out, csv_header):
+        community_motivation, csv_out, csv_header, check_social_total=False, player_store=False, stop_when_stable=True, timings=False, allocation=None):
+        if timings:
+            construction_start = default_timer()
+
         #------------------------------------------------------------------
         # Create resource pool, objective pool, and dictionary of players
         #------------------------------------------------------------------
-        self.resource_pool = ResourcePool(num_resources, num_players, approximate_high_low_resource_ratio)
-        self.objective_pool = ObjectivePool(self.resource_pool, num_players, num_objs_per_player, approximate_high_low_objective_ratio, value_high, value_low)
+        if allocation is None:
+            allocation = allocate(num_players, num_resources, num_objs_per_player,
+                approximate_high_low_resource_ratio, approximate_high_low_objective_ratio, value_high, value_low)
+        elif len(allocation.players_list) != num_players or len(allocation.objs_index) != num_players * num_objs_per_player:
+            raise Exception("The allocation is for a different number of players or objectives")
+
+        self.resource_pool = allocation.resource_pool
+        self.objective_pool = allocation.objective_pool
         self.objs_table = self.objective_pool.table
 
         # Initialize simulation-wide variables passed to the class
@@ -127,21 +153,20 @@ class CollaborationModel():
         self.community_motivation = community_motivation
         self.csv_out = csv_out
         self.csv_header = csv_header
-
-        # Temporary sanity checking...
-        # The algorithm chokes with high faux pareto values on variation 3, because it can be infinite
-        if self.variation == 3:
-          self.faux_pareto_rounds_without_merges = 5
+        self.stop_when_stable = stop_when_stable
 
         # Initialize empty players dictionary (only a dictionary so it can be indexed)
         players = {}
 
-        # Build the players list and index of objectives
-        players_list = range(num_players)
-        objs_index = range(self.objective_pool.num_objs)
+        # Optionally keep the players' data in flat arrays instead of individual objects
+        if player_store:
+            self.store = PlayerStore(num_players, num_resources, self.objs_table)
+        else:
+            self.store = None
 
-        shuffle(players_list)
-        shuffle(objs_index)
+        # The shuffled players list and index of objectives
+        players_list = allocation.players_list
+        objs_index = allocation.objs_index
 
         # `count` keeps track of the number of times a resource is allocated to a player. It will only ever go up to `num_players`
         count = 0
@@ -155,7 +180,10 @@ class CollaborationModel():
         for resource, quantity in sorted(self.resource_pool.pool.items()):
             for i in range(quantity):
                 # Create a new player and add it to the players dictionary
-                players[players_list[count]] = Player(name="Player %02d"%players_list[count], resource=resource, objective_indices=objs_index[start:stop:1], objectives_table=self.objs_table)
+                if self.store is not None:
+                    players[players_list[count]] = StoredPlayer(self.store, players_list[count], resource=resource, objective_indices=objs_index[start:stop:1])
+                else:
+                    players[players_list[count]] = Player(name="Player %02d"%players_list[count], resource=resource, objective_indices=objs_index[start:stop:1], objectives_table=self.objs_table, num_resources=num_resources)
 
                 # Increment everything
                 count += 1
@@ -169,7 +197,7 @@ class CollaborationModel():
         #--------------------------
         self.teams = []
         for i, player in enumerate(self.players.values()):
-            startingTeam = Team(i)
+            startingTeam = Team(i, self.num_resources)
             startingTeam.addPlayer(player)
             self.teams.append(startingTeam)
             self.players[i].setInitialTeam(startingTeam)
@@ -177,7 +205,8 @@ class CollaborationModel():
         #------------------------------
         # Initialize community object
         #------------------------------
-        self.community = Community(self.players, self.teams)
+        self.community = Community(self.players, self.teams, check_social_total)
+        self.counters = self.community.counters  # How encounters ended and how often the hot methods ran (see RunCounters)
 
         #-----------------------------------------
         # Initialize other object-wide variables
@@ -193,6 +222,14 @@ class CollaborationModel():
 
         self.dropped_objectives = []  # Keep track of dropped objectives
         self.traded_objectives = []  # Keep track of traded objectives
+        self.unstable_pair = None  # The last pair of players is_stable() found that could still change something
+
+        # Seconds spent in each phase of the simulation (see PHASES), or None when timing is off
+        if timings:
+            self.phase_times = dict.fromkeys(PHASES, 0.0)
+            self.phase_times['construction'] = default_timer() - construction_start
+        else:
+            self.phase_times = None
 
     def test_run(self):
         """Temporary function for running a single pair of players through one of the variations."""
@@ -219,7 +256,7 @@ class CollaborationModel():
 
 
     def run(self, run_number):
-        """Runs the actual simulation by pairing players off into random pairs and allowing each pair to collaborate, if beneficial. Players are paired off and interact until `faux_pareto_rounds_without_merges` rounds in a row pass with no trades or collaboration.
+        """Runs the actual simulation by pairing players off into random pairs and allowing each pair to collaborate, if beneficial. Players are paired off and interact until no pair of players can collaborate any more (if `stop_when_stable` is true), or until `faux_pareto_rounds_without_merges` rounds in a row pass with no trades or collaboration.
 
         Args:
             run_number: An integer that keeps track of how many times a simulation has been run; used as the row ID number in the exported CSV.
@@ -229,11 +266,30 @@ class CollaborationModel():
         merges_this_round = 0
         total_merges = 0
         total_encounters = 0
+        rounds = 0
+        cycle_length = 0
+
+        # Only look at the clock when timing is on
+        phase_times = self.phase_times
+        if phase_times is not None:
+            started = default_timer()
+
+        # In variation 3 team membership is the whole state, so remember the round each state was first seen in to catch cycles
+        if self.variation == 3:
+            state = self.community.membership_hash
+            seen_states = {state: 0}
+        else:
+            seen_states = None
 
         # Capture pre-simulation data
         before_total = str(self.community.total())
         individual_statistics_before = self.community.individualStats()
 
+        if phase_times is not None:
+            now = default_timer()
+            phase_times['export'] += now - started
+            started = now
+
         # print "Running self.variation {0} with a {1} focus".format(self.variation, "community" if self.community_motivation else "self-interested"), "\n"
         
         # # Temporary team reporting
@@ -261,6 +317,11 @@ class CollaborationModel():
                 pairs_of_players = list(pairs(players_list))  # Pair each player index up randomly
                 shuffle(pairs_of_players)
 
+                if phase_times is not None:
+                    now = default_timer()
+                    phase_times['pairing'] += now - started
+                    started = now
+
                 for pair in pairs_of_players:
                     a = self.players[pair[0]]
                     b = self.players[pair[1]]
@@ -269,148 +330,52 @@ class CollaborationModel():
                         if self.variations[self.variation](a, b) == True:  # Run the specified variation algorithm
                             merges_this_round += 1
                         total_encounters += 1  # Update how many encounters occurred
+
+                if phase_times is not None:
+                    now = default_timer()
+                    phase_times['decisions'] += now - started
+                    started = now
                 
-                if merges_this_round == 0:  # If no merges happened this round, mark it
+                rounds += 1
+                changed = merges_this_round > 0
+                if seen_states is not None:  # In variation 3 accepted invitations don't move anyone, so only count rounds where somebody changed teams
+                    previous_state, state = state, self.community.membership_hash
+                    changed = state != previous_state
+
+                if not changed:  # If no merges happened this round, mark it
                     rounds_without_merges += 1
                 else:  # Otherwise, reset the count of rounds without merges. The simulation stops after x tradeless rounds *in a row*
                     rounds_without_merges = 0
                 
-                if rounds_without_merges == self.faux_pareto_rounds_without_merges : break  # If x rounds without merges happen, stop looping
+                if rounds_without_merges == self.faux_pareto_rounds_without_merges :  # If x rounds without merges happen, stop looping
+                    total_merges += merges_this_round
+                    break
+
+                if self.stop_when_stable and not changed:
+                    stable = self.is_stable()
+                    if phase_times is not None:
+                        now = default_timer()
+                        phase_times['stability'] += now - started
+                        started = now
+                    if stable:  # If nothing can change any more, every later round would be empty, so stop now
+                        total_merges += merges_this_round
+                        break
+
+                if seen_states is not None and changed:  # If the teams changed back to how they were after an earlier round, the run is going in circles
+                    if state in seen_states:
+                        cycle_length = rounds - seen_states[state]
+                        total_merges += merges_this_round
+                        break
+                    seen_states[state] = rounds
 
 
         #----------------
         # Export to CSV
         #----------------
-        # Capture post-simulation data
-        team_statistics = self.community.teamStats()
-        individual_statistics_after = self.community.individualStats()
-        subset = self.community.objectivesSubset()
+        self.export(run_number, before_total, individual_statistics_before, total_encounters, total_merges, cycle_length)
 
-        # Start the massive list of tuples to be exported to the CSV file; e.g., [("column_1", value_1), ("column_2", value_2)]
-        csv_data = []
-
-        # Basic simulation information
-        csv_data.append(("id", run_number + 1))
-        csv_data.append(("variation", self.variation))
-        csv_data.append(("player_count", self.num_players))
-        csv_data.append(("community_motivation", 1 if self.community_motivation else 0))
-        csv_data.append(("encounters", total_encounters))
-        csv_data.append(("switches", total_merges))
-        csv_data.append(("switch_ratio", total_merges / float(total_encounters)))
-
-        # Team information
-        csv_data.append(("number_of_teams", team_statistics.number))
-        csv_data.append(("team_size_min", team_statistics.min))
-        csv_data.append(("team_size_max", team_statistics.max))
-        csv_data.append(("team_size_mean", team_statistics.mean))
-        csv_data.append(("team_size_median", team_statistics.median))
-
-        # Individual statistics
-        csv_data.append(("indiv_total_min_before", individual_statistics_before.min))
-        csv_data.append(("indiv_total_max_before", individual_statistics_before.max))
-        csv_data.append(("indiv_total_mean_before", individual_statistics_before.mean))
-        csv_data.append(("indiv_total_median_before", individual_statistics_before.median))
-        csv_data.append(("indiv_total_min_after", individual_statistics_after.min))
-        csv_data.append(("indiv_total_max_after", individual_statistics_after.max))
-        csv_data.append(("indiv_total_mean_after", individual_statistics_after.mean))
-        csv_data.append(("indiv_total_median_after", individual_statistics_after.median))
-        csv_data.append(("indiv_delta_mean", individual_statistics_after.mean - individual_statistics_before.mean))
-        csv_data.append(("indiv_delta_median", individual_statistics_after.median - individual_statistics_before.median))
-
-        # Social statistics
-        csv_data.append(("social_value_before", before_total))
-        csv_data.append(("social_value_after", self.community.total()))
-        csv_data.append(("potential_social_value", self.community.potentialTotal(self.objs_table)))
-        csv_data.append(("unmet_social_value", self.community.potentialTotal(self.objs_table) - self.community.total()))
-        csv_data.append(("percent_social_value_met", self.community.total() / float(self.community.potentialTotal(self.objs_table))))
-
-        # General objective statistics
-        csv_data.append(("num_resources", self.num_resources))
-        csv_data.append(("num_objectives", len(self.objective_pool.table)))
-        csv_data.append(("objs_fulfilled", len(subset.fulfilled)))
-        csv_data.append(("objs_held_unfulfilled", len(subset.unfulfilled)))
-        csv_data.append(("objs_dropped", len(self.dropped_objectives)))
-        csv_data.append(("objs_traded", len(self.traded_objectives)))
-        csv_data.append(("objs_fulfilled_ratio", len(subset.fulfilled) / float(len(self.objective_pool.table))))
-        csv_data.append(("objs_unfulfilled_ratio", (len(subset.unfulfilled) + len(self.dropped_objectives)) / float(len(self.objective_pool.table))))
-
-        # Resource-specific objective statistics
-        # This loop creates columns for each objective, organized by resource (i.e. a1, a2, b1, b2, etc.)
-        for resource in self.resource_pool.resources_list:
-            # Variable names (a1, b2, etc.)
-            high_value_objective = resource[0].lower() + str(1)
-            low_value_objective = resource[0].lower() + str(2)
-
-            # Initialize count variables
-            fulfilled_count_high = 0
-            unfulfilled_count_high = 0
-            dropped_count_high = 0
-            traded_count_high = 0
-            obj_count_high = 0
-            fulfilled_count_low = 0
-            unfulfilled_count_low = 0
-            dropped_count_low = 0
-            traded_count_low = 0
-            obj_count_low = 0
-
-            # Count stuff
-            for obj in self.objective_pool.obj_list:
-                if resource[0] == obj[0][0].upper():
-                    if obj[1] == self.value_high: 
-                        obj_count_high += 1 
-                    else:
-                        obj_count_low += 1
-
-            for obj in subset.fulfilled:
-                if resource[0] == obj[0][0].upper():
-                    if obj[1] == self.value_high: 
-                        fulfilled_count_high += 1 
-                    else:
-                        fulfilled_count_low += 1
-
-            for obj in subset.unfulfilled: 
-                if resource[0] == obj[0][0].upper():
-                    if obj[1] == self.value_high: 
-                        unfulfilled_count_high += 1 
-                    else:
-                        unfulfilled_count_low += 1
-
-            for obj in self.dropped_objectives:
-                if resource[0] == obj[0][0].upper():
-                    if obj[1] == self.value_high: 
-                        dropped_count_high += 1 
-                    else:
-                        dropped_count_low += 1
-
-            for obj in self.traded_objectives: 
-                if resource[0] == obj[0][0].upper():
-                    if obj[1] == self.value_high: 
-                        traded_count_high += 1 
-                    else:
-                        traded_count_low += 1
-
-            # Add counts the csv_data list of tuples
-            csv_data.append(("{0}_value".format(high_value_objective), self.value_high))
-            csv_data.append(("{0}_count".format(high_value_objective), obj_count_high))
-            csv_data.append(("{0}_high_freq".format(high_value_objective), 1 if resource[1] == "high_freq" else 0))
-            csv_data.append(("{0}_trades".format(high_value_objective), traded_count_high))
-            csv_data.append(("{0}_dropped".format(high_value_objective), dropped_count_high))
-            csv_data.append(("{0}_fulfilled".format(high_value_objective), fulfilled_count_high))
-            csv_data.append(("{0}_pct_fulfilled".format(high_value_objective), fulfilled_count_high/float(obj_count_high)))
-            csv_data.append(("{0}_held_unfulfilled".format(high_value_objective), unfulfilled_count_high))
-
-            csv_data.append(("{0}_value".format(low_value_objective), self.value_low))
-            csv_data.append(("{0}_count".format(low_value_objective), obj_count_low))
-            csv_data.append(("{0}_high_freq".format(low_value_objective), 1 if resource[1] == "high_freq" else 0))
-            csv_data.append(("{0}_trades".format(low_value_objective), traded_count_low))
-            csv_data.append(("{0}_dropped".format(low_value_objective), dropped_count_low))
-            csv_data.append(("{0}_fulfilled".format(low_value_objective), fulfilled_count_low))
-            csv_data.append(("{0}_pct_fulfilled".format(low_value_objective), fulfilled_count_low/float(obj_count_low)))
-            csv_data.append(("{0}_held_unfulfilled".format(low_value_objective), unfulfilled_count_low))
- 
-        # Finally output the csv_data list to the CSV file
-        if run_number == 0 and self.csv_header: self.csv_out.writerow([data[0] for data in csv_data])  # Output headers on the first run
-        self.csv_out.writerow([data[1] for data in csv_data])  # Output the data
+        if phase_times is not None:
+            phase_times['export'] += default_timer() - started
 
         # print "-----------------------------------------------------------------------------------------------------------------------"
         # print "Final team allocations:"
@@ -428,10 +393,154 @@ class CollaborationModel():
         # print "-----------------------------------------------------------------------------------------------------------------------"
 
 
+    def export(self, run_number, before_total, individual_statistics_before, total_encounters, total_merges, cycle_length):
+        """Writes a row of results for a finished run to `csv_out` (and the column names first, if `csv_header` is true and this is the first run).
+
+        Args:
+            run_number: The run's number; the row's `id` is one more
+            before_total: The social value before the run (as a string)
+            individual_statistics_before: The Community.individualStats() from before the run
+            total_encounters: How many encounters there were
+            total_merges: How many encounters changed teams or objectives
+            cycle_length: The length of the cycle that ended the run in variation 3, or 0
+
+        The columns are the ones from export_columns(). Each list of objectives is tallied by (resource, tier) in a single pass, so the cost doesn't depend on the number of resources times the number of objectives.
+        """
+        # Capture post-simulation data
+        team_statistics = self.community.teamStats()
+        individual_statistics_after = self.community.individualStats()
+        subset = self.community.objectivesSubset()
+        social_total = self.community.total()
+        potential_total = self.community.potentialTotal(self.objs_table)
+        num_objectives = len(self.objs_table)
+
+        # Tally every list of objectives by (resource, tier) in a single pass each
+        fulfilled = Counter((obj.resource, obj.tier) for obj in subset.fulfilled)
+        unfulfilled = Counter((obj.resource, obj.tier) for obj in subset.unfulfilled)
+        dropped = Counter((obj.resource, obj.tier) for obj in self.dropped_objectives)
+        traded = Counter((obj.resource, obj.tier) for obj in self.traded_objectives)
+
+        # The row's values, in the order of export_columns()
+        row = [
+            # Basic simulation information
+            run_number + 1, self.variation, self.num_players, 1 if self.community_motivation else 0,
+            total_encounters, total_merges, total_merges / float(total_encounters), cycle_length,
+
+            # Team information
+            team_statistics.number, team_statistics.min, team_statistics.max, team_statistics.mean, team_statistics.median,
+
+            # Individual statistics
+            individual_statistics_before.min, individual_statistics_before.max, individual_statistics_before.mean, individual_statistics_before.median,
+            individual_statistics_after.min, individual_statistics_after.max, individual_statistics_after.mean, individual_statistics_after.median,
+            individual_statistics_after.mean - individual_statistics_before.mean, individual_statistics_after.median - individual_statistics_before.median,
+
+            # Social statistics
+            before_total, social_total, potential_total, potential_total - social_total, social_total / float(potential_total),
+
+            # General objective statistics
+            self.num_resources, num_objectives, len(subset.fulfilled), len(subset.unfulfilled),
+            len(self.dropped_objectives), len(self.traded_objectives),
+            len(subset.fulfilled) / float(num_objectives), (len(subset.unfulfilled) + len(self.dropped_objectives)) / float(num_objectives)]
+
+        # Resource-specific objective statistics, for each objective organized by resource (i.e. a1, a2, b1, b2, etc.)
+        for resource, frequency in self.resource_pool.resources_list:
+            for tier, value in ((HIGH_VALUE_TIER, self.value_high), (LOW_VALUE_TIER, self.value_low)):
+                key = (resource, tier)
+                count = self.objective_pool.pool.get(key, 0)
+                row.extend([value, count, 1 if frequency == "high_freq" else 0, traded[key], dropped[key],
+                    fulfilled[key], fulfilled[key] / float(count), unfulfilled[key]])
+
+        # How the encounters ended and how many times the most used methods were called (see RunCounters)
+        row.extend(count for name, count in self.counters.columns())
+
+        # Finally output the row to the CSV file
+        if run_number == 0 and self.csv_header: self.csv_out.writerow(export_columns(self.resource_pool.resources_list))  # Output headers on the first run
+        self.csv_out.writerow(row)  # Output the data
+
+
+    def is_stable(self):
+        """Returns true if no pair of players on different teams could change any teams or objectives under the current variation and motivation, in either order. Once this is true, every later round would leave everything as it is.
+
+        Every variation only gains value when someone gets access to a resource they lack, either from a new teammate or with a traded objective. So a pair of teams is only worth checking if one team has a resource that a player on the other team lacks (see Player.lackingResources()); all pairs of players on other pairs of teams are skipped. With personal motivation in variations 1-4, nothing happens unless player A gains, so only players who lack one of the other team's resources (or in variation 4, player B's own resource) are checked as player A. The remaining pairs are run through the variation with `dry_run=True`, which changes nothing and uses no random numbers.
+
+        The check is only worth running after a round that changed nothing. The pair that could still change something last time is tried first, since it usually still can.
+        """
+        decide = self.variations[self.variation]
+
+        if self.unstable_pair is not None:
+            player_a, player_b = self.unstable_pair
+            if player_a.team != player_b.team and (decide(player_a, player_b, dry_run=True) or decide(player_b, player_a, dry_run=True)):
+                return False
+
+        # Index the active teams by the resources they have, and the teams and players by the resources they lack
+        teams_with = [[] for resource in range(self.num_resources)]
+        teams_lacking = [[] for resource in range(self.num_resources)]
+        players_lacking = [[] for resource in range(self.num_resources)]
+        for team in self.community.activeTeams():
+            team_lacking = 0
+            for player in team.players:
+                lacking = player.lackingResources()
+                team_lacking |= lacking
+                for resource in range(self.num_resources):
+                    if lacking & resource_bit(resource):
+                        players_lacking[resource].append(player)
+
+            for resource in range(self.num_resources):
+                if team.resource_mask & resource_bit(resource):
+                    teams_with[resource].append(team)
+                if team_lacking & resource_bit(resource):
+                    teams_lacking[resource].append(team)
+
+        checked = set()
+        if self.community_motivation is False and self.variation == 4:
+            # Player A has to gain something from player B's own resource, since they would leave their teams for a new one
+            for resource in range(self.num_resources):
+                for team_b in teams_with[resource]:
+                    for player_b in team_b.players:
+                        if player_b.resource != resource:
+                            continue
+                        for player_a in players_lacking[resource]:
+                            if player_a.team != player_b.team and decide(player_a, player_b, dry_run=True):
+                                self.unstable_pair = (player_a, player_b)
+                                return False
+        elif self.community_motivation is False and self.variation != 5:
+            # Player A has to gain something from player B's team
+            for resource in range(self.num_resources):
+                for player_a in players_lacking[resource]:
+                    for team_b in teams_with[resource]:
+                        if (player_a, team_b.index) in checked:
+                            continue
+                        checked.add((player_a, team_b.index))
+
+                        for player_b in team_b.players:
+                            if decide(player_a, player_b, dry_run=True):
+                                self.unstable_pair = (player_a, player_b)
+                                return False
+        else:
+            # Someone on one of the teams has to gain something from the other team
+            for resource in range(self.num_resources):
+                for team_a in teams_lacking[resource]:
+                    for team_b in teams_with[resource]:
+                        pair_key = (min(team_a.index, team_b.index), max(team_a.index, team_b.index))
+                        if pair_key in checked:
+                            continue
+                        checked.add(pair_key)
+
+                        for player_a in team_a.players:
+                            for player_b in team_b.players:
+                                if decide(player_a, player_b, dry_run=True) or decide(player_b, player_a, dry_run=True):
+                                    self.unstable_pair = (player_a, player_b)
+                                    return False
+
+        return True
+
+
     #-----------------------------------------------------------------------------------------------
     # Decision algorithms
     #
     # Each variation takes two arguments: `player_a` and `player_b`, which must be player objects.
+    # With `dry_run=True`, a variation only returns whether the encounter could change any teams or 
+    # objectives, without changing anything or using any random numbers.
     #-----------------------------------------------------------------------------------------------
 
     def largest_matching_team(self, player_a, player_b):
@@ -449,13 +558,13 @@ class CollaborationModel():
             return False
 
 
-    def variation_5(self, player_a, player_b):
+    def variation_5(self, player_a, player_b, dry_run=False):
         """Simple trading with no networking. Player A meets Player B. They figure out the best one-shot trade. Player A selects the best possible objective to give away, as does Player B. If both mutually benefit, make the trade. Otherwise, walk away."""
         traded = False
 
         # Determine best objective to give away
-        a_best_to_give = player_a.best_given_objective(player_a.resource, player_b.resource)
-        b_best_to_give = player_b.best_given_objective(player_b.resource, player_a.resource)
+        a_best_to_give = player_a.best_given_objective(player_a.resource_bit, player_b.resource)
+        b_best_to_give = player_b.best_given_objective(player_b.resource_bit, player_a.resource)
 
         # Calculate hypothetical totals with those traded objectives
         a_total_if_no_trade = player_a.currentTotal()
@@ -476,28 +585,39 @@ class CollaborationModel():
 
             # If the community benefits, trade. Otherwise don't do anything
             if community_delta_if_trade > 0:
-                player_a.giveObjective(a_best_to_give, player_b, traded_objectives_list=self.traded_objectives)
-                player_b.giveObjective(b_best_to_give, player_a, traded_objectives_list=self.traded_objectives)
                 traded = True
 
         else:  # If self.community_motivation is false...
             # If both players benefit, trade. Otherwise don't do anything
             if a_delta_if_trade > 0 and b_delta_if_trade > 0: 
-                player_a.giveObjective(a_best_to_give, player_b, traded_objectives_list=self.traded_objectives)
-                player_b.giveObjective(b_best_to_give, player_a, traded_objectives_list=self.traded_objectives)
                 traded = True
 
+        if dry_run:
+            return traded
+
+        # Count how the encounter ended; with personal motivation, A gaining when B doesn't means B refused
+        if traded:
+            self.counters.accepted += 1
+        elif self.community_motivation is not True and a_delta_if_trade > 0:
+            self.counters.refused += 1
+        else:
+            self.counters.no_gain += 1
+
+        if traded:
+            player_a.giveObjective(a_best_to_give, player_b, traded_objectives_list=self.traded_objectives)
+            player_b.giveObjective(b_best_to_give, player_a, traded_objectives_list=self.traded_objectives)
+
         return traded
 
 
-    def variation_1(self, player_a, player_b):
+    def variation_1(self, player_a, player_b, dry_run=False):
         """To network with another player, the requesting player (Player A) must drop one objective of their choice and leave it unfulfilled."""
         merged = False
         team_a = player_a.team
         team_b = player_b.team
 
-        joint_resources_if_b_joins_a = uniquify(list(player_a.team.resources()) + list(player_b.resource))
-        joint_resources_if_a_goes_to_b = uniquify(list(player_b.team.resources()) + list(player_a.resource))
+        joint_resources_if_b_joins_a = player_a.team.resource_mask | player_b.resource_bit
+        joint_resources_if_a_goes_to_b = player_b.team.resource_mask | player_a.resource_bit
 
         a_best_if_stay = player_a.best_given_objective(joint_resources_if_b_joins_a)
         a_best_if_move = player_a.best_given_objective(joint_resources_if_a_goes_to_b)
@@ -515,16 +635,9 @@ class CollaborationModel():
         if self.community_motivation is True:  # MAYBE: This function is fine, but it's totally reusable. Make this more DRY-ish for the other variations.
             community_before = self.community.total()
 
-            # Calculate deltas for all members of the team
-            a_other_deltas = 0
-            b_other_deltas = 0
-            for player in [ p for p in team_a.players if p != player_a ]: # Iterate through all of the players on team A--exlcuding player A--to check their deltas
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                a_other_deltas += player_delta
-
-            for player in [ p for p in team_b.players if p != player_b ]: 
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                b_other_deltas += player_delta
+            # Calculate deltas for all members of the team--excluding player A or B--if player B's resource were added to their team
+            a_other_deltas = team_a.gainIfAdded(player_b, excluding=player_a)
+            b_other_deltas = team_b.gainIfAdded(player_b, excluding=player_b)
 
             community_total_a_to_b = community_before + a_delta_if_move + b_delta_if_stay + b_other_deltas
             community_total_b_to_a = community_before + a_delta_if_stay + b_delta_if_move + a_other_deltas
@@ -532,15 +645,20 @@ class CollaborationModel():
             community_delta_a_to_b = community_total_a_to_b - community_before
             community_delta_b_to_a = community_total_b_to_a - community_before
 
+            if dry_run:  # One of the branches below moves a player exactly when the better option helps the community
+                return max(community_delta_a_to_b, community_delta_b_to_a) > 0
+
             if community_delta_a_to_b > 0 and community_delta_a_to_b > community_delta_b_to_a:
                 # print "A should move to B"
                 player_a.joinTeam(team_b)
                 player_a.dropObjective(a_best_if_move, dropped_objectives_list=self.dropped_objectives)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_b_to_a > 0 and community_delta_b_to_a > community_delta_a_to_b:
                 # print "B should move to A"
                 player_b.joinTeam(team_a)
                 player_a.dropObjective(a_best_if_stay, dropped_objectives_list=self.dropped_objectives)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_a_to_b > 0 and community_delta_a_to_b == community_delta_b_to_a:
                 # print "Choose one..." 
@@ -550,9 +668,11 @@ class CollaborationModel():
                 else:
                     player_a.joinTeam(team_b)
                     player_a.dropObjective(a_best_if_move, dropped_objectives_list=self.dropped_objectives)
+                self.counters.tie_break += 1
                 merged = True
             else:
                 # print "Don't do anything"
+                self.counters.no_gain += 1
                 merged = False
 
         else:  # If self.community_motivation is false...
@@ -596,15 +716,17 @@ class CollaborationModel():
             # If both changes are negative, don't do anything
             if a_delta_if_stay <= 0 and a_delta_if_move <= 0:
                 # print "All net changes are bad. Don't do anything."
+                if not dry_run:
+                    self.counters.no_gain += 1
                 merged = False
 
             # If moving to B's team is better than staying, ask permission to move
             elif a_delta_if_move >= 0 and a_delta_if_move > a_delta_if_stay:
-                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move)
+                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move, dry_run=dry_run)
 
             # If staying is better than moving to B's team, invite B to join
             elif a_delta_if_stay >= 0 and a_delta_if_stay > a_delta_if_move:
-                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay)
+                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay, dry_run=dry_run)
 
             # If staying and moving give the same benefit, let B choose which one they want to do
             elif a_delta_if_stay == a_delta_if_move and a_delta_if_move > 0:
@@ -613,36 +735,40 @@ class CollaborationModel():
                 if b_delta_if_move >= 0 and b_delta_if_move > b_delta_if_stay:
                     # print "B wants to move"
                     # merged = self.move(player_b, player_a, a_delta_if_move, a_delta_if_stay, objective_to_drop=a_best_if_stay)
-                    merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay)
+                    merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay, dry_run=dry_run)
                 elif b_delta_if_stay >= 0 and b_delta_if_stay > b_delta_if_move:
                     # print "B wants to stay"
                     # merged = self.invite(player_b, player_a, a_delta_if_move, a_delta_if_stay, a_best_if_move)
-                    merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move)
+                    merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move, dry_run=dry_run)
                 elif b_delta_if_stay == b_delta_if_move and b_delta_if_move > 0:
                     # print "Choose a random thing"
+                    if dry_run:  # Either choice is accepted and can change the teams, so don't use up a random choice
+                        return True
                     actions = [self.move, self.invite]
                     action = choice(actions)
 
                     if action == self.move:
-                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move)
+                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_move, tie_break=True)
                     else:
-                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay)
+                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_drop=a_best_if_stay, tie_break=True)
                     
                 else:
                     # print "Not a good deal for B. Don't do anything."
+                    if not dry_run:
+                        self.counters.refused += 1
                     merged = False
 
         return merged
 
 
-    def variation_2(self, player_a, player_b):
+    def variation_2(self, player_a, player_b, dry_run=False):
         """To network with another player, the requesting player (Player A) must offer one objective of their choice as payment to the recipient (Player B)."""
         merged = False
         team_a = player_a.team
         team_b = player_b.team
 
-        joint_resources_if_b_joins_a = uniquify(list(player_a.team.resources()) + list(player_b.resource))
-        joint_resources_if_a_goes_to_b = uniquify(list(player_b.team.resources()) + list(player_a.resource))
+        joint_resources_if_b_joins_a = player_a.team.resource_mask | player_b.resource_bit
+        joint_resources_if_a_goes_to_b = player_b.team.resource_mask | player_a.resource_bit
 
         a_best_if_stay = player_a.best_given_objective(joint_resources_if_b_joins_a)
         a_best_if_move = player_a.best_given_objective(joint_resources_if_a_goes_to_b)
@@ -668,16 +794,9 @@ class CollaborationModel():
         if self.community_motivation is True:
             community_before = self.community.total()
 
-            # Calculate deltas for all members of the team
-            a_other_deltas = 0
-            b_other_deltas = 0
-            for player in [ p for p in team_a.players if p != player_a ]: # Iterate through all of the players on team A--exlcuding player A--to check their deltas
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                a_other_deltas += player_delta
-
-            for player in [ p for p in team_b.players if p != player_b ]: 
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                b_other_deltas += player_delta
+            # Calculate deltas for all members of the team--excluding player A or B--if player B's resource were added to their team
+            a_other_deltas = team_a.gainIfAdded(player_b, excluding=player_a)
+            b_other_deltas = team_b.gainIfAdded(player_b, excluding=player_b)
 
             community_total_a_to_b = community_before + a_delta_if_move + b_delta_if_stay + b_other_deltas
             community_total_b_to_a = community_before + a_delta_if_stay + b_delta_if_move + a_other_deltas
@@ -685,15 +804,20 @@ class CollaborationModel():
             community_delta_a_to_b = community_total_a_to_b - community_before
             community_delta_b_to_a = community_total_b_to_a - community_before
 
+            if dry_run:  # One of the branches below moves a player exactly when the better option helps the community
+                return max(community_delta_a_to_b, community_delta_b_to_a) > 0
+
             if community_delta_a_to_b > 0 and community_delta_a_to_b > community_delta_b_to_a:
                 # print "A should move to B"
                 player_a.giveObjective(a_best_if_move, player_b, traded_objectives_list=self.traded_objectives)
                 player_a.joinTeam(team_b)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_b_to_a > 0 and community_delta_b_to_a > community_delta_a_to_b:
                 # print "B should move to A"
                 player_a.giveObjective(a_best_if_stay, player_b, traded_objectives_list=self.traded_objectives)
                 player_b.joinTeam(team_a)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_a_to_b > 0 and community_delta_a_to_b == community_delta_b_to_a:
                 # print "Choose one..."
@@ -703,9 +827,11 @@ class CollaborationModel():
                 else:
                     player_a.giveObjective(a_best_if_move, player_b, traded_objectives_list=self.traded_objectives)
                     player_a.joinTeam(team_b)
+                self.counters.tie_break += 1
                 merged = True
             else:
                 # print "Don't do anything"
+                self.counters.no_gain += 1
                 merged = False
 
         else:  # If self.community_motivation is false...
@@ -770,15 +896,17 @@ class CollaborationModel():
             # If both changes are negative, don't do anything
             if a_delta_if_stay <= 0 and a_delta_if_move <= 0:
                 # print "All net changes are bad. Don't do anything."
+                if not dry_run:
+                    self.counters.no_gain += 1
                 merged = False
 
             # If moving to B's team is better than staying, ask permission to move
             elif a_delta_if_move >= 0 and a_delta_if_move > a_delta_if_stay:
-                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move)
+                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move, dry_run=dry_run)
 
             # If staying is better than moving to B's team, invite B to join
             elif a_delta_if_stay >= 0 and a_delta_if_stay > a_delta_if_move:
-                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay)
+                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay, dry_run=dry_run)
 
             # If staying and moving give the same benefit, let B choose which one they want to do
             elif a_delta_if_stay == a_delta_if_move and a_delta_if_move > 0:
@@ -787,30 +915,34 @@ class CollaborationModel():
                 if b_delta_if_move >= 0 and b_delta_if_move > b_delta_if_stay:
                     # print "B wants to move"
                     # merged = self.move(player_b, player_a, a_delta_if_move, a_delta_if_stay, objective_to_give=a_best_if_stay)
-                    merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay)
+                    merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay, dry_run=dry_run)
                 elif b_delta_if_stay >= 0 and b_delta_if_stay > b_delta_if_move:
                     # print "B wants to stay"
                     # merged = self.invite(player_b, player_a, a_delta_if_move, a_delta_if_stay, a_best_if_move)
-                    merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move)
+                    merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move, dry_run=dry_run)
                 elif b_delta_if_stay == b_delta_if_move and b_delta_if_move > 0:
                     # print "Choose a random thing"
+                    if dry_run:  # Either choice is accepted and can change the teams, so don't use up a random choice
+                        return True
                     actions = [self.move, self.invite]
                     action = choice(actions)
 
                     if action == self.move:
-                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move)
+                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_move, tie_break=True)
                     else:
-                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay)
+                        merged = action(player_a, player_b, b_delta_if_move, b_delta_if_stay, objective_to_give=a_best_if_stay, tie_break=True)
                     
                 else:
                     # print "Not a good deal for B. Don't do anything."
+                    if not dry_run:
+                        self.counters.refused += 1
                     merged = False
 
         # print "\n***********************************\n"
         return merged
 
 
-    def variation_3(self, player_a, player_b):
+    def variation_3(self, player_a, player_b, dry_run=False):
         """To network with another player, both players must agree to network."""
         merged = False
         team_a = player_a.team
@@ -829,16 +961,9 @@ class CollaborationModel():
         if self.community_motivation is True:
             community_before = self.community.total()
 
-            # Calculate deltas for all members of the team
-            a_other_deltas = 0
-            b_other_deltas = 0
-            for player in [ p for p in team_a.players if p != player_a ]: # Iterate through all of the players on team A--exlcuding player A--to check their deltas
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                a_other_deltas += player_delta
-
-            for player in [ p for p in team_b.players if p != player_b ]: 
-                player_delta = player.currentTotal(player_b, object_is_team=False) - player.currentTotal()
-                b_other_deltas += player_delta
+            # Calculate deltas for all members of the team--excluding player A or B--if player B's resource were added to their team
+            a_other_deltas = team_a.gainIfAdded(player_b, excluding=player_a)
+            b_other_deltas = team_b.gainIfAdded(player_b, excluding=player_b)
 
             community_total_a_to_b = community_before + a_delta_if_move + b_delta_if_stay + b_other_deltas
             community_total_b_to_a = community_before + a_delta_if_stay + b_delta_if_move + a_other_deltas
@@ -846,13 +971,18 @@ class CollaborationModel():
             community_delta_a_to_b = community_total_a_to_b - community_before
             community_delta_b_to_a = community_total_b_to_a - community_before
 
+            if dry_run:  # One of the branches below moves a player exactly when the better option helps the community
+                return max(community_delta_a_to_b, community_delta_b_to_a) > 0
+
             if community_delta_a_to_b > 0 and community_delta_a_to_b > community_delta_b_to_a:
                 # print "A should move to B"
                 player_a.joinTeam(team_b)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_b_to_a > 0 and community_delta_b_to_a > community_delta_a_to_b:
                 # print "B should move to A"
                 player_b.joinTeam(team_a)
+                self.counters.accepted += 1
                 merged = True
             elif community_delta_a_to_b > 0 and community_delta_a_to_b == community_delta_b_to_a:
                 # print "Choose one..."
@@ -860,9 +990,11 @@ class CollaborationModel():
                     player_b.joinTeam(team_a)
                 else:
                     player_a.joinTeam(team_b)
+                self.counters.tie_break += 1
                 merged = True
             else:
                 # print "Don't do anything"
+                self.counters.no_gain += 1
                 merged = False
 
         else: # If self.community_motivation is false...
@@ -895,15 +1027,17 @@ class CollaborationModel():
             # If both changes are negative, don't do anything
             if a_delta_if_stay <= 0 and a_delta_if_move <= 0:
                 # print "All net changes are bad. Don't do anything."
+                if not dry_run:
+                    self.counters.no_gain += 1
                 merged = False
 
             # If moving to B's team is better than staying, ask permission to move
             elif a_delta_if_move >= 0 and a_delta_if_move > a_delta_if_stay:
-                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay)
+                merged = self.move(player_a, player_b, b_delta_if_move, b_delta_if_stay, dry_run=dry_run)
 
             # If staying is better than moving to B's team, invite B to join
             elif a_delta_if_stay >= 0 and a_delta_if_stay > a_delta_if_move:
-                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay)
+                merged = self.invite(player_a, player_b, b_delta_if_move, b_delta_if_stay, dry_run=dry_run)
 
             # If staying and moving give the same benefit, let B choose which one they want to do
             elif a_delta_if_stay == a_delta_if_move and a_delta_if_move > 0:
@@ -911,22 +1045,26 @@ class CollaborationModel():
 
                 if b_delta_if_move >= 0 and b_delta_if_move > b_delta_if_stay:
                     # print "Try to move to A"
-                    merged = self.move(player_b, player_a, a_delta_if_move, a_delta_if_stay)
+                    merged = self.move(player_b, player_a, a_delta_if_move, a_delta_if_stay, dry_run=dry_run)
                 elif b_delta_if_stay >= 0 and b_delta_if_stay > b_delta_if_move:
                     # print "Invite A to join B"
-                    merged = self.invite(player_b, player_a, a_delta_if_move, a_delta_if_stay)
+                    merged = self.invite(player_b, player_a, a_delta_if_move, a_delta_if_stay, dry_run=dry_run)
                 elif b_delta_if_stay == b_delta_if_move and b_delta_if_move > 0:
                     # print "Choose a random thing"
+                    if dry_run:  # Either choice is accepted and can change the teams, so don't use up a random choice
+                        return True
                     actions = [self.move, self.invite]
-                    merged = choice(actions)(player_b, player_a, a_delta_if_move, a_delta_if_stay)
+                    merged = choice(actions)(player_b, player_a, a_delta_if_move, a_delta_if_stay, tie_break=True)
                 else:
                     # print "Not a good deal for B"
+                    if not dry_run:
+                        self.counters.refused += 1
                     merged = False
 
         return merged
 
 
-    def variation_4(self, player_a, player_b):
+    def variation_4(self, player_a, player_b, dry_run=False):
         """To network with another player, both players must agree to network. No team can contain more than two players."""
         merge_occurred = False
         team_a = player_a.team
@@ -1002,10 +1140,20 @@ class CollaborationModel():
                     # print "Just kidding. B doesn't want to do anything."
                     merge_occurred = False
 
+        if dry_run:
+            return merge_occurred
+
+        # Count how the encounter ended; with personal motivation, one player gaining when the other doesn't means they refused
+        if merge_occurred:
+            self.counters.accepted += 1
+        elif self.community_motivation is not True and (a_delta_if_new_team > 0 or b_delta_if_new_team > 0):
+            self.counters.refused += 1
+        else:
+            self.counters.no_gain += 1
+
         if merge_occurred:
             # print "Yay! Something good happened!"
-            newTeam = Team(self.community.last_team_index() + 1)
-            self.teams.append(newTeam)
+            newTeam = self.community.newTeam(self.num_resources)
             player_a.joinTeam(newTeam)
             player_b.joinTeam(newTeam)
             return True
@@ -1015,81 +1163,93 @@ class CollaborationModel():
 
 
     # Globalish invitation and moving algorithms
-    def invite(self, inviter, invitee, delta_if_move, delta_if_stay, objective_to_drop=None, objective_to_give=None):
+    # With `dry_run`, both only report whether anything would change, without changing anything
+    # Both count the outcome in `counters`; with `tie_break`, a random choice picked the action, so it counts as a tie-break instead
+    def invite(self, inviter, invitee, delta_if_move, delta_if_stay, objective_to_drop=None, objective_to_give=None, dry_run=False, tie_break=False):
         if (objective_to_drop and objective_to_give):
             raise Exception("Cannot pass `objective_to_drop` and `objective_to_give` at the same time.")
 
         # print "{0} inviting {1}".format(inviter.name, invitee.name)
         if delta_if_move >= 0 and delta_if_move > delta_if_stay:
             # print "This is the ideal situation. Permission granted."
-            if objective_to_drop:
-                inviter.dropObjective(objective_to_drop, dropped_objectives_list=self.dropped_objectives)
-            if objective_to_give:
-                inviter.giveObjective(objective_to_give, invitee, traded_objectives_list=self.traded_objectives)
-            invitee.joinTeam(invitee.team)
-            return True
+            accepted, outcome = True, 'accepted'
         elif delta_if_stay >= 0 and delta_if_stay > delta_if_move:
             # print "It's better if the invitee stays... " 
-            return False
+            accepted, outcome = False, 'held_out'
         elif delta_if_move == delta_if_stay and delta_if_move > 0:
             # print "It doesn't matter to the invitee. Permission granted."
+            accepted, outcome = True, 'accepted'
+        else:
+            # print "Permission denied"
+            accepted, outcome = False, 'refused'
+
+        if dry_run:  # The invitee joins their own team, so only a dropped or given objective changes anything
+            return accepted and bool(objective_to_drop or objective_to_give)
+
+        if tie_break:
+            outcome = 'tie_break'
+        setattr(self.counters, outcome, getattr(self.counters, outcome) + 1)
+
+        if accepted:
             if objective_to_drop:
                 inviter.dropObjective(objective_to_drop, dropped_objectives_list=self.dropped_objectives)
             if objective_to_give:
                 inviter.giveObjective(objective_to_give, invitee, traded_objectives_list=self.traded_objectives)
             invitee.joinTeam(invitee.team)
-            return True
-        else:
-            # print "Permission denied"
-            return False
+        return accepted
 
-    def move(self, asker, asked, delta_if_move, delta_if_stay, objective_to_drop=None, objective_to_give=None):
+    def move(self, asker, asked, delta_if_move, delta_if_stay, objective_to_drop=None, objective_to_give=None, dry_run=False, tie_break=False):
         if (objective_to_drop and objective_to_give):
             raise Exception("Cannot pass `objective_to_drop` and `objective_to_give` at the same time.")
 
         # print "{0} trying to join {1}".format(asker.name, asked.name)
         if delta_if_stay > 0 and delta_if_stay > delta_if_move:
             # print "This is the ideal situation. Permission granted."
-            if objective_to_drop:
-                asker.dropObjective(objective_to_drop, dropped_objectives_list=self.dropped_objectives)
-            if objective_to_give:
-                asker.giveObjective(objective_to_give, asked, traded_objectives_list=self.traded_objectives)
-            asker.joinTeam(asked.team)
-            return True
+            accepted, outcome = True, 'accepted'
         elif delta_if_move > 0 and delta_if_move > delta_if_stay:
             # print "It's better if the asked moves... "
-            return False
+            accepted, outcome = False, 'held_out'
         elif delta_if_stay == delta_if_move and delta_if_stay > 0:
             # print "It doesn't matter to the asked. Permission granted."
+            accepted, outcome = True, 'accepted'
+        else:
+            # print "Permission denied"
+            accepted, outcome = False, 'refused'
+
+        if not dry_run:
+            if tie_break:
+                outcome = 'tie_break'
+            setattr(self.counters, outcome, getattr(self.counters, outcome) + 1)
+
+        if accepted and not dry_run:
             if objective_to_drop:
                 asker.dropObjective(objective_to_drop, dropped_objectives_list=self.dropped_objectives)
             if objective_to_give:
                 asker.giveObjective(objective_to_give, asked, traded_objectives_list=self.traded_objectives)
             asker.joinTeam(asked.team)
-            return True
-        else:
-            # print "Permission denied"
-            return False
+        return accepted
 
 class ResourcePool:
     """Creates a pool of resources with high and low distributions according to the frequency in `approximate_high_low_resource_ratio`
-    
+
+    Resources are integer ids (0, 1, 2, ...). Names (i.e. "A", "B", ..., "Z", "AA", ...) are only built from the ids with resource_name() when exporting, so there is no limit on the number of resources.
+
     For example, if there are 16 players, with 4 different types of resources, and an approximate ratio of 3:1, the pool will be a dictionary distributed like so:
-    {'A': 6, 'B': 6, 'C': 2, 'D': 2}
-    with A and B as high frequency resources and C and D as low frequency
-    
+    {0: 6, 1: 6, 2: 2, 3: 2}
+    with 0 and 1 (A and B) as high frequency resources and 2 and 3 (C and D) as low frequency
+
     Attributes:
-        high: A string of the high frequency resources (e.g. "AB")
-        low: A string of the low frequency resources (e.g. "CD")
-        resources_list: A list of tuples (e.g. [('A', 'high_freq'), ('B', 'high_freq'), ('C', 'low_freq'), ('D', 'low_freq')])
-        pool: A dictionary structured like {'resource name': quantity, ...}
-    
-    Returns: 
+        high: A list of the high frequency resource ids (e.g. [0, 1])
+        low: A list of the low frequency resource ids (e.g. [2, 3])
+        resources_list: A list of tuples (e.g. [(0, 'high_freq'), (1, 'high_freq'), (2, 'low_freq'), (3, 'low_freq')])
+        pool: A dictionary structured like {resource id: quantity, ...}
+
+    Returns:
         A resource pool object
     """
     def __init__(self, resources, players, approximate_high_low_resource_ratio):
         """Create the resource pool object
-        
+
         Args:
             resources: The number of resource types
             players: The number of players in the simulation
@@ -1099,10 +1259,10 @@ class ResourcePool:
         self.low = divided.low
 
         resources_list = []
-        for resource in list(divided.high):
+        for resource in divided.high:
             resources_list.append((resource, "high_freq"))
 
-        for resource in list(divided.low):
+        for resource in divided.low:
             resources_list.append((resource, "low_freq"))
 
         self.resources_list = sorted(resources_list)
@@ -1114,8 +1274,8 @@ class ResourcePool:
         """Add a fraction priority to the given high frequency resources
 
         Args:
-            prop_high: A string of letters that will have a high frequency distribution (e.g. "AB")
-            prop_low: A string of letters that will have a low frequency distribution (e.g. "CDE")
+            prop_high: A list of resource ids that will have a high frequency distribution (e.g. [0, 1])
+            prop_low: A list of resource ids that will have a low frequency distribution (e.g. [2, 3, 4])
         """
         prop_high_adjusted = prop_high * approximate_high_low_resource_ratio
         while True:
@@ -1126,98 +1286,92 @@ class ResourcePool:
 
     def divide_high_low(self, resources):
         """Divide the provided resources into high and low frequencies
-        
+
         Args:
             resources: The number of resource types
-        
+
         Returns:
-            A named tuple of high and low frequency resources (e.g. (high='AB', low='CD'))
+            A named tuple of high and low frequency resource ids (e.g. (high=[0, 1], low=[2, 3]))
         """
-        DivdedResources = namedtuple('Resources', ['high', 'low'])
-        letters = ascii_uppercase[:resources]
+        ids = range(resources)
         high_count = resources // 2
 
-        # letters = ''.join(sample(letters, len(letters)))  # Don't randomly assign resources to high and low
-        letters = ''.join(letters)
+        # ids = sample(ids, len(ids))  # Don't randomly assign resources to high and low
 
-        prop_high, prop_low = letters[:high_count], letters[high_count:]
-        return DivdedResources(prop_high, prop_low)
+        prop_high, prop_low = ids[:high_count], ids[high_count:]
+        return DividedResources(prop_high, prop_low)
 
 
 class ObjectivePool:
-    """Create a pool of objectives that corresponds to the distribution of the resource pool. 
-    
-    The objectives that correspond to the two frequencies of resources (high and low) are split into two types of prevalence (high and low). If there are two high frequency resources A and B, there will be four objectives: a1, a2, b1, and b2. 
-    
-    A subscript of 1 indicates high value, while a subscript of 2 indicates low value. 
+    """Create a pool of objectives that corresponds to the distribution of the resource pool.
+
+    The objectives that correspond to the two frequencies of resources (high and low) are split into two types of prevalence (high and low). If there are two high frequency resources A and B, there will be four objectives: a1, a2, b1, and b2.
+
+    A subscript of 1 indicates high value, while a subscript of 2 indicates low value.
     The objectives for resource A will be more prevalent than the objectives for resource B according to the ratio provided in `approximate_high_low_objective_ratio`
-    
-    For example, with a resource pool of {'A': 6, 'B': 6, 'C': 2, 'D': 2} and five objectives per player, the high frequency resources A and B will be split into highly prevalent objectives (15 a1s and a2s) and not-as-prevalent objectives (5 b1s and b2s). Low frequency resources will be split similarly (15 c1/2s, 5 d1/2s). 
-    
+
+    Internally each objective is an Objective named tuple of integers: the id of the resource that fulfills it, its value tier (HIGH_VALUE_TIER or LOW_VALUE_TIER, the subscript), and its value. Names like a1 are only built with objective_name() when exporting.
+
+    For example, with a resource pool of {'A': 6, 'B': 6, 'C': 2, 'D': 2} and five objectives per player, the high frequency resources A and B will be split into highly prevalent objectives (15 a1s and a2s) and not-as-prevalent objectives (5 b1s and b2s). Low frequency resources will be split similarly (15 c1/2s, 5 d1/2s).
+
     Attributes:
         num_objs: The total number of objectives in the pool (number of players * number of objectives per player)
-        pool: A dictionary of objective distributions (e.g. {'a1': 15, 'a2': 15, 'b1': 5, 'b2': 5, 'c2': 15, 'c1': 15, 'd2': 5, 'd1': 5}) (a dictionary so that the objectives can be indexed)
-        table: A list of dictionaries with each objective name and value (e.g. [{'name': 'a1', 'value': 20},... {'name': 'c2', 'value': 10},...])
-    
-    Returns: 
+        pool: A dictionary of objective distributions keyed by (resource id, tier) (e.g. {(0, 1): 15, (0, 2): 15, (1, 1): 5, (1, 2): 5, ...}) (a dictionary so that the objectives can be indexed)
+        table: A list of Objective named tuples, sorted by resource and tier (e.g. [Objective(resource=0, tier=1, value=20),... Objective(resource=2, tier=2, value=10),...])
+
+    Returns:
         An objective pool object
     """
     def __init__(self, resource_pool, num_players, num_objs_per_player, approximate_high_low_objective_ratio, value_high, value_low):
         """Create the objective pool object
-        
+
         Args:
             resource_pool: A ResourcePool object
         """
         self.num_objs = num_players * num_objs_per_player
-        
+        tier_values = {HIGH_VALUE_TIER: value_high, LOW_VALUE_TIER: value_low}
+
         # Switch the first and last elements of the high and low frequency lists
         list_high = list(resource_pool.high)
         list_low = list(resource_pool.low)
-        
+
         # Calculate half of list length
-        temp1 = len(list_high)/2 
+        temp1 = len(list_high)/2
         temp2 = len(list_low)/2
-        
+
         # Create new lists based on slices of the high and low lists
         new_high = list_high[:temp1] + list_low[:temp2]
         new_low = list_high[temp1:] + list_low[temp2:]
 
         # Split all the resources into two objectives
-        # Converts "A" to "a1" and "a2"
+        # Converts resource 0 to (0, 1) and (0, 2), i.e. "A" to "a1" and "a2"
         objectives_high = []
         for i in new_high:
-            for j in range(1,3):
-                objectives_high.append(i.lower() + str(j))
+            for tier in (HIGH_VALUE_TIER, LOW_VALUE_TIER):
+                objectives_high.append((i, tier))
 
         objectives_low = []
         for i in new_low:
-            for j in range(1,3):
-                objectives_low.append(i.lower() + str(j))
+            for tier in (HIGH_VALUE_TIER, LOW_VALUE_TIER):
+                objectives_low.append((i, tier))
 
         # Distribute the objectives to the newly created objectives
         o = self.create_distribution_ratios(objectives_low, objectives_high, approximate_high_low_objective_ratio)
         self.pool = dict(sorted(Counter(islice(o, self.num_objs)).items()))
 
-        # Create a list of named dictionary pairs for each objective in the pool
+        # Create a list of objectives in the pool, in resource and tier order
         objs_table = []
-        objs_list = []
-        for i in self.pool.items():
-            for j in range(i[1]):
-                if int(i[0][1]) == 1: # if the objective's subscript is 1 (e.g. "a1")
-                    value = value_high
-                else:
-                    value = value_low
-                objs_table.append({'name':i[0], 'value':value})
-                objs_list.append([i[0], value])
+        for (resource, tier), quantity in sorted(self.pool.items()):
+            for j in range(quantity):
+                objs_table.append(Objective(resource, tier, tier_values[tier]))
         self.table = objs_table
-        self.obj_list = objs_list
 
     def create_distribution_ratios(self, prop_low, prop_high, approximate_high_low_objective_ratio):
         """Add a fraction priority to the given high frequency resources
 
         Args:
-            prop_high: A string of letters that will have a high frequency distribution (e.g. "AB")
-            prop_low: A string of letters that will have a low frequency distribution (e.g. "CDE")
+            prop_high: A list of (resource id, tier) objectives that will have a high frequency distribution (e.g. [(0, 1), (0, 2)])
+            prop_low: A list of (resource id, tier) objectives that will have a low frequency distribution (e.g. [(1, 1), (1, 2)])
         """
         prop_high_adjusted = prop_high * approximate_high_low_objective_ratio
         while True:
@@ -1234,37 +1388,117 @@ class Community:
 
     Attributes:
         players: A dictionary of the player objects provided at initialization
-        teams: A list of the team objects provided at initialization
+        teams: A list of the team objects provided at initialization, plus any teams added by newTeam()
+        live_teams: An OrderedDict of the teams with at least one player, keyed by team index, in the order they got their first player. Kept up to date by updateTeams() whenever a player joins a team.
+        free_teams: A list of the teams that players have left empty, which newTeam() hands out again before creating any new ones
+        social_total: The running social value of the community, updated by players through adjustTotal() whenever they join a team, drop an objective, or give an objective away
+        check_social_total: Boolean; if true, total() checks the running social value against a full recompute
+        counters: A RunCounters object counting encounter outcomes and calls to the most used methods
+        membership_hash: A Zobrist-style fingerprint of which team every player is on: the XOR of a random 64-bit key for each (player, team) pair. Players update it through moveMembership() whenever they join a team, so two identical team line-ups always have the same hash.
     
     Returns: 
         A new community object
     """
-    def __init__(self, players, teams):
+    def __init__(self, players, teams, check_social_total=False):
         """
         Initialize community object with given players and teams.
 
         Args:
             players: A dictionary of player objects to be added to the community (generated in CollaborationModel::build())
             teams: A list of team objects to be added to the community (also generated in CollaborationModel::build())
+            check_social_total: Boolean that defaults to false. If true, every call to total() is checked against recomputeTotal().
         """
         self.players = players
         self.teams = teams
+        self.check_social_total = check_social_total
+        self.counters = RunCounters()
+        self.live_teams = OrderedDict((team.index, team) for team in self.teams if team.players)
+        self.free_teams = [team for team in self.teams if not team.players]
+
+        # Membership keys come from their own random number generator, so hashing doesn't change the simulation's random numbers
+        self.membership_keys = {}
+        self.membership_random = Random(MEMBERSHIP_HASH_SEED)
+        self.membership_hash = 0
+
+        for i, player in self.players.items():
+            player.community = self  # Players report changes to their totals and teams back to the community
+            self.membership_hash ^= self.membershipKey(player, player.team)
+        self.social_total = self.recomputeTotal()
     
     def total(self):
-        """Returns the combined values of all teams in the community, or the current social value of the community."""
+        """Returns the combined values of all teams in the community, or the current social value of the community.
+
+        Raises:
+            A general exception if `check_social_total` is true and the running total doesn't match a full recompute.
+        """
+        self.counters.community_total += 1
+        if self.check_social_total:
+            recomputed = self.recomputeTotal()
+            if recomputed != self.social_total:
+                raise Exception("Running social total {0} doesn't match recomputed total {1}".format(self.social_total, recomputed))
+        return self.social_total
+
+    def recomputeTotal(self):
+        """Returns the social value of the community by summing every player's current total."""
         total = 0
         for i, player in self.players.items():
             total += player.currentTotal()
         return total
 
+    def adjustTotal(self, delta):
+        """Adds the change in a player's (or a team's) value to the running social total."""
+        self.social_total += delta
+
+    def membershipKey(self, player, team):
+        """Returns the random key for a player being on a team, creating it the first time it is needed."""
+        key = self.membership_keys.get((player, team.index))
+        if key is None:
+            key = self.membership_keys[(player, team.index)] = self.membership_random.getrandbits(64)
+        return key
+
+    def moveMembership(self, player, old_team, new_team):
+        """Updates membership_hash when a player leaves one team for another."""
+        self.membership_hash ^= self.membershipKey(player, old_team) ^ self.membershipKey(player, new_team)
+
+    def updateTeams(self, old_team, new_team):
+        """Updates live_teams and free_teams after a player leaves one team for another."""
+        if old_team is new_team:
+            return
+        if not old_team.players:
+            del self.live_teams[old_team.index]
+            self.free_teams.append(old_team)
+        if len(new_team.players) == 1:
+            self.live_teams[new_team.index] = new_team
+
+    def newTeam(self, num_resources):
+        """Returns an empty team for players to join, reusing a team that players have left empty if there is one, so the list of teams never grows past one more than the number of players.
+
+        Used in variation 4 of the simulation, where pairs of players leave their teams to make a new one.
+
+        Args:
+            num_resources: The number of resource types in the simulation
+        """
+        while self.free_teams:
+            team = self.free_teams.pop()
+            if not team.players:  # Somebody may have joined it since it was emptied
+                return team
+
+        team = Team(self.last_team_index() + 1, num_resources)
+        self.teams.append(team)
+        return team
+
     def activeTeams(self):
-        """Returns a list of all teams in the community that have at least one player."""
-        return [ team for team in self.teams if team.playerCount() > 0 ]
+        """Returns a list of all teams in the community that have at least one player, in the order they got their first player."""
+        return self.live_teams.values()
+
+    def activeTeamCount(self):
+        """Returns the number of teams in the community that have at least one player, without looking at the teams."""
+        return len(self.live_teams)
 
     def last_team_index(self):
         """Returns the index of the last team in the community.
 
-        Used in variation 4 of the simulation, where new teams of two players are added to the community. 
+        Used by newTeam() in variation 4 of the simulation, where new teams of two players are added to the community. 
         Those teams use the next sequential team index when created.
         """
         return self.teams[-1].index
@@ -1275,8 +1509,7 @@ class Community:
         Returns a named tuple of class 'TeamStatistics' with attributes number, min, max, mean, and median.
         """
         team_sizes = [ team.playerCount() for team in self.activeTeams() ]
-        TeamStatistics = namedtuple('TeamStatistics', 'number, min, max, mean, median')
-        return TeamStatistics(len(team_sizes), min(team_sizes), max(team_sizes), mean(team_sizes), median(team_sizes))
+        return TeamStatistics(self.activeTeamCount(), min(team_sizes), max(team_sizes), mean(team_sizes), median(team_sizes))
 
     def individualStats(self):
         """Calculate basic summary statistics for the players in the community.
@@ -1284,16 +1517,15 @@ class Community:
         Returns a named tuple of class 'IndividualStatistics' with attributes number, min, max, mean, and median.
         """
         player_scores = [player.currentTotal() for i, player in self.players.items() ]
-        IndividualStatistics = namedtuple('IndividualStatistics', 'min, max, mean, median')
         return IndividualStatistics(min(player_scores), max(player_scores), mean(player_scores), median(player_scores))
 
     def potentialTotal(self, objectives_table):
         """Returns the potential total community social value given the objectives available in the simulation.
 
         Args: 
-            objectives_table: List of dictionaries of objectives in an ObjectivePool() object (e.g. [{'name': 'a1', 'value': 20},... {'name': 'c2', 'value': 10},...])
+            objectives_table: List of Objective named tuples in an ObjectivePool() object (e.g. [Objective(resource=0, tier=1, value=20),...])
         """
-        return sum(objective['value'] for objective in objectives_table)
+        return sum(objective.value for objective in objectives_table)
 
     def objectivesSubset(self):
         """Determines which of the objectives in the community have been fulfilled (i.e. the player holding the objective has access to a matching resource in their team).
@@ -1302,7 +1534,6 @@ class Community:
 
         Returns a named tuple of class 'ObjectivesSubset' with attributes fulfilled and unfulfilled.
         """
-        ObjectivesSubset = namedtuple('ObjectivesSubset', 'fulfilled, unfulfilled')
         fulfilled = []
         unfulfilled = []
 
@@ -1315,6 +1546,34 @@ class Community:
         return ObjectivesSubset(fulfilled, unfulfilled)
 
 
+class RunCounters(object):
+    """Counts how every encounter in a run ended and how many times the most used methods were called. One is kept by each Community and exported with the run.
+
+    Outcomes (encounters in is_stable()'s dry runs aren't counted):
+        accepted: Somebody changed teams or objectives, without a random choice
+        no_gain: Player A (or, with community motivation, the community) gains nothing either way
+        refused: Player B gains nothing from what player A asks for (in variations 4 and 5, one player would gain but the other wouldn't)
+        held_out: Player B turns down a move or invitation because B would gain more from the other one
+        tie_break: A random choice decided between moving and inviting, or which player moves
+
+    Calls (including the ones made while building the model, checking is_stable(), and exporting the rest of the row):
+        current_total: Player.currentTotal()
+        community_total: Community.total()
+        best_given_objective: Player.best_given_objective()
+    """
+    outcomes = ('accepted', 'no_gain', 'refused', 'held_out', 'tie_break')
+    calls = ('current_total', 'community_total', 'best_given_objective')
+    __slots__ = outcomes + calls
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def columns(self):
+        """Returns a list of (column name, count) tuples for the exported CSV, e.g. [("encounters_accepted", 12), ..., ("current_total_calls", 2048), ...]"""
+        return [("encounters_{0}".format(name), getattr(self, name)) for name in self.outcomes] + [("{0}_calls".format(name), getattr(self, name)) for name in self.calls]
+
+
 class Team:
     """A team is a collection of players that have decided to collaborate in order to achieve higher personal or societal value. 
     
@@ -1322,67 +1581,117 @@ class Team:
         name: The team's name
         index: The index of the team (zero-based)
         players: A list of player objects that are part of the team
+        resource_counts: A Counter of how many players on the team hold each resource id, kept up to date by addPlayer() and removePlayer()
+        resource_mask: An integer bitmask of the resources available on the team, used to calculate actual and hypothetical totals
+        value_by_resource: A list of the total value of all members' objectives for each resource id (the sum of the members' Player.value_by_resource). Values for resources missing from `resource_mask` are unmet.
     
     Returns:
         A new team object
     """
-    def __init__(self, index):
+    def __init__(self, index, num_resources):
         """Creates a new team object consisting of exactly one player.
-        
+
         Args:
-            name: The player's name
-            player: A single player object
+            index: The index of the team
+            num_resources: The number of resource types in the simulation
         """
         self.name = "Team %02d"%index 
         self.index = index
         self.players = []
+        self.resource_counts = Counter()  # How many players on the team hold each resource (i.e. {0: 2, 2: 1})
+        self.resource_mask = 0  # Bitmask of the resources in `resource_counts` (see resource_bit())
+        self.value_by_resource = [0] * num_resources  # Members' objective values summed by resource id
     
     def playerCount(self):
         """Returns a count how many players there are on the team."""
         return len(self.players)
     
     def resources(self):
-        """Returns a list of all unique resources available on the team."""
-        resources = []
-        for player in self.players:
-            resources.append(player.resource)
-        return uniquify(resources)
+        """Returns a list of all unique resource ids available on the team."""
+        return [ resource for resource, count in self.resource_counts.items() if count > 0 ]
     
-    def totalValue(self, newPlayer=None):
-        """Returns a team's current value.
+    def gainIfAdded(self, player, excluding=None):
+        """Returns how much the team's members would gain in total if a player's resource were added to the team.
+
+        Only the unmet value for that resource counts, so this is a single lookup instead of a loop over the team.
+
+        Args:
+            player: The player object whose resource would be added
+            excluding: Optionally pass a member of the team whose gain should be left out (i.e. the player making the decision)
+        """
+        if self.resource_mask & player.resource_bit:  # The team already has the resource, so nobody gains anything
+            return 0
+        gain = self.value_by_resource[player.resource]
+        if excluding is not None:
+            gain -= excluding.value_by_resource[player.resource]
+        return gain
+
+    def totalValue(self, newPlayer=None, add=(), remove=()):
+        """Returns a team's current value, or its hypothetical value with players added or removed.
+
+        Nothing is copied: the hypothetical resource mask is worked out from the team's resource counts, and the value is the team's value by resource corrected by the players being added or removed.
 
         Args:
             newPlayer: Optionally pass a player object to calculate the team's value with that player on the team
+            add: Optionally pass a list of player objects (not on the team) to calculate the team's value with them on the team
+            remove: Optionally pass a list of player objects (on the team) to calculate the team's value without them
         """
-        if newPlayer is None:   # If no new hypothetical player is specified, use the regular team players
-            players = self.players
-        else:   # Otherwise, temporarily add the extra player to a copy of the team
-            players = deepcopy(self.players)
-            players.append(newPlayer)
-        
-        total = 0
-        for player in players:
-            total += player.currentTotal()
+        if newPlayer is not None:
+            add = list(add) + [newPlayer]
+
+        if not add and not remove:   # If no hypothetical players are specified, use the team's value by resource
+            return masked_sum(self.value_by_resource, self.resource_mask)
+
+        # Determine which resources would be left on the team after removing players, then add the new players' resources
+        resources = self.resource_mask
+        if remove:
+            removed_counts = Counter(player.resource for player in remove)
+            for resource, count in removed_counts.items():
+                if self.resource_counts[resource] - count <= 0:
+                    resources &= ~resource_bit(resource)
+        for player in add:
+            resources |= player.resource_bit
+
+        # Value the team's objectives with the hypothetical resources, then correct for the players leaving or joining
+        total = masked_sum(self.value_by_resource, resources)
+        for player in remove:
+            total -= masked_sum(player.value_by_resource, resources)
+        for player in add:
+            total += masked_sum(player.value_by_resource, resources)
         return total
     
     def report(self):
         """Pretty prints a sentence explaining the team's current standing.
 
-        For example, "We are Team 02; we have Player 02, Player 05 on our team; we have resources ['D', 'C']; and our total social value is 60."
+        For example, "We are Team 02; we have Player 02, Player 05 on our team; we have resources ['C', 'D']; and our total social value is 60."
         """
         if self.players:
             players = ', '.join('%s' % player.name for player in self.players)  # Build a comma separated list of players
-            print "We are %s; we have %s on our team; we have resources %s; and our total social value is %s."%(self.name, players, self.resources(), self.totalValue())
+            resources = [resource_name(resource) for resource in sorted(self.resources())]
+            print "We are %s; we have %s on our team; we have resources %s; and our total social value is %s."%(self.name, players, resources, self.totalValue())
         else:
             print "%s is empty." % (self.name)
     
     def addPlayer(self, player):
-        """Adds a given player object to the team."""
+        """Adds a given player object to the team and adds their resource to the team's resource mask."""
         self.players.append(player)
+        self.resource_counts[player.resource] += 1
+        self.resource_mask |= player.resource_bit
+        self.adjustValues(player.value_by_resource, 1)
     
     def removePlayer(self, player):
-        """Removes a given player object from the team."""
+        """Removes a given player object from the team. The player's resource is only removed from the team's resource mask if nobody else on the team holds it."""
         self.players.remove(player)
+        self.resource_counts[player.resource] -= 1
+        if self.resource_counts[player.resource] == 0:
+            self.resource_mask &= ~player.resource_bit
+        self.adjustValues(player.value_by_resource, -1)
+
+    def adjustValues(self, values, sign):
+        """Adds (sign = 1) or subtracts (sign = -1) a list of values by resource id to the team's value_by_resource."""
+        for resource, value in enumerate(values):
+            if value:
+                self.value_by_resource[resource] += sign * value
 
 
 class Player:
@@ -1390,29 +1699,37 @@ class Player:
     
     Attributes:
         name: The player's name
-        resource: The name of a resource (i.e. "A")
-        objectives: A dictionary of lists, corresponding to the objective index, objective name, and objective value. (i.e. {0: ['a1', 20], 1: ['d1', 20], 2: ['a2', 10], 3: ['b2', 10], 4: ['c1', 20]})
+        resource: The id of a resource (i.e. 0 for "A"), also its position in value_by_resource lists
+        resource_bit: The bit representing the player's resource in a team's resource mask (i.e. 1 for "A", 4 for "C")
+        community: The Community object the player belongs to (None until the community is created); kept informed of changes to the player's value
+        objectives: A dictionary of Objective named tuples, keyed by objective index. (i.e. {0: Objective(resource=0, tier=1, value=20), 1: Objective(resource=3, tier=1, value=20), 2: Objective(resource=0, tier=2, value=10)}, or a1, d1, and a2)
+        value_by_resource: A list of the total value of the player's objectives for each resource id (i.e. [30, 0, 0, 20] for the objectives above). Kept up to date by dropObjective() and giveObjective().
     
     Returns:
         A new player object
     """
 
-    def __init__(self, name, resource, objective_indices, objectives_table):
+    def __init__(self, name, resource, objective_indices, objectives_table, num_resources):
         """Creates a new player object based on resource and objective pools created beforehand.
-        
+
         Args:
             name: The player's name
-            resource: The name of a resource (i.e. "A")
+            resource: The id of a resource (i.e. 0 for "A")
             objective_indices: A list of objective indices (i.e. [1, 2, 3, 4, 5])
-            objectives_table: List of dictionaries of objectives in an ObjectivePool() object (e.g. [{'name': 'a1', 'value': 20},... {'name': 'c2', 'value': 10},...])
+            objectives_table: List of Objective named tuples in an ObjectivePool() object (e.g. [Objective(resource=0, tier=1, value=20),...])
+            num_resources: The number of resource types in the simulation
         """
         self.name = name
         self.resource = resource
-        
-        # Build the dictionary of lists: {`index`: [`objective name`, `objective value`]}
+        self.resource_bit = resource_bit(resource)
+        self.community = None
+
+        # Build the dictionary of objectives: {`index`: Objective(`resource id`, `tier`, `value`)}
         self.objectives = {}
+        self.value_by_resource = [0] * num_resources
         for i in objective_indices:
-            self.objectives[i] = [objectives_table[i]['name'], objectives_table[i]['value']]
+            self.objectives[i] = objectives_table[i]
+            self.value_by_resource[objectives_table[i].resource] += objectives_table[i].value
 
     def currentTotal(self, test_object=None, object_is_team=True, new_team=False, alone=False, objective_to_drop=None, given_objective=None, giver=None):
         """Returns a player's current total, summing the values of all objectives that match a player's assigned resource. Additional arguments return the player's hypothetical total.
@@ -1432,6 +1749,9 @@ class Player:
             A general exception if the method is called with giver and not with given_objective, since given_objective requires that someone gives that objective.
         """
 
+        if self.community is not None:
+            self.community.counters.current_total += 1
+
         # Check to make sure the method is called properly
         if (object_is_team is True or test_object is None) and new_team is True:
             raise Exception("Can't use `new_team` on a team object or without a `test_object`")
@@ -1440,41 +1760,34 @@ class Player:
         if giver is None and not given_objective is None:
             raise Exception("Can't have a `giver` without a `given_objective`") 
 
-        # Determine which objectives to use in the total calculation
-        if given_objective and objective_to_drop:  # If an objective is dropped and given away, like in variation 5...
-            objectives = deepcopy(self.objectives)  # Make a copy of the dictionary
-            del objectives[objective_to_drop]  # Remove the objective
-            objectives[given_objective] = giver.objectives[given_objective]
-        else:  # All other variations
-            if not objective_to_drop is None:
-                objectives = deepcopy(self.objectives)  # Make a copy of the dictionary
-                del objectives[objective_to_drop]  # Remove the objective
-            elif not given_objective is None:
-                objectives = deepcopy(self.objectives)  # Make a copy of the dictionary
-                objectives[given_objective] = giver.objectives[given_objective]
-            else:
-                objectives = self.objectives  # Use the full dictionary of objectives
-
         # Determine which pool of resources to use in the total calculation
+        # Resource pools are bitmasks, so combining them is a single OR (see resource_bit())
         if alone:  # If alone, just use the player's single given resource; nobody else's
-            resources = self.resource
+            resources = self.resource_bit
         elif test_object is None and not alone:  # If no object is specified, use the actual team
-            resources = self.team.resources()
+            resources = self.team.resource_mask
         else:  # Create a hypothetical pool of team resources
             if object_is_team == True:  # Combine the hypothetical team's resources and the actual player's single resource
-                    resources = uniquify(test_object.resources() + list(self.resource))
+                    resources = test_object.resource_mask | self.resource_bit
             else:
                 if new_team == True:  # Combine the single resource of the actual player and the single resource of the hypothetical player
-                    resources = uniquify(list(self.resource) + list(test_object.resource))
+                    resources = self.resource_bit | test_object.resource_bit
                 else:  # Combine the hypothetical player's single resource and the actual player's team resources
-                    resources = uniquify(self.team.resources() + list(test_object.resource))  
+                    resources = self.team.resource_mask | test_object.resource_bit
         
         # Calculate the total of each fulfilled objective, given the player's hypothetical or actual objectives and hypothetical or actual resource pool
-        total = 0
-        for index, details in objectives.items():  # objectives.items() is a dictionary with a list, i.e. {41: ['c2', 10], 5: ['a1', 20], 13: ['a1', 20], 30: ['b1', 20], 71: ['d2', 10]}
-            for resource in resources:
-                if resource == details[0][0].upper():  # details[0] is the first element in the list, i.e. 'c2'. details[0][0] is the first letter, i.e. 'c'
-                    total += details[1]  # details[1] is the second element in the list, i.e. 10
+        # Actual objectives are already summed by resource, so only add up the resources in the pool
+        total = masked_sum(self.value_by_resource, resources)
+
+        # Hypothetical objectives are worked out from the change alone, without copying the objectives dictionary
+        if given_objective and objective_to_drop:  # If an objective is dropped and given away, like in variation 5...
+            total -= fulfilled_value(self.objectives[objective_to_drop], resources)  # Remove the objective (raises KeyError for unknown objectives, like `del`)
+            total += fulfilled_value(giver.objectives[given_objective], resources)  # Add the given objective
+        else:  # All other variations
+            if not objective_to_drop is None:
+                total -= fulfilled_value(self.objectives[objective_to_drop], resources)
+            elif not given_objective is None:
+                total += fulfilled_value(giver.objectives[given_objective], resources)
 
         return total
 
@@ -1484,19 +1797,16 @@ class Player:
         Returns a named tuple of class 'ObjectivesSubset' with attributes fulfilled and unfulfilled.
         """
         # Retrieve the player's resources and objectives
-        resources = self.team.resources()
+        resources = self.team.resource_mask
         objectives = self.objectives
 
-        ObjectivesSubset = namedtuple('ObjectivesSubset', 'fulfilled, unfulfilled')
-
-        met = {}  # Initialize the met dictionary, which mirrors the structure of the community's objective pool (i.e. {5: ['a1', 20], 30: ['b1', 20]})
-        for index, details in objectives.items():  # See comments at the end of Player::currentTotal() for an explanation of objective.items() and details[]
-            for resource in resources:
-                if resource == details[0][0].upper():
-                    met[index] = details
+        met = {}  # Initialize the met dictionary, which mirrors the structure of the player's objectives (i.e. {5: Objective(resource=0, tier=1, value=20)})
+        for index, details in objectives.items():  # objectives.items() is a dictionary of Objective named tuples, i.e. {41: Objective(resource=2, tier=2, value=10), 5: Objective(resource=0, tier=1, value=20)}
+            if resources & objective_bit(details):
+                met[index] = details
 
         unfulfilled_indexes = [objective for objective in objectives if objective not in met]  # See which objectives weren't met
-        unmet = {i : objectives[i] for i in unfulfilled_indexes}  # Dictionary comprehension to create unmet dictionary, mirroring the structure of met (i.e. {0: ['a1', 20], 26: ['b2', 10], 27: ['b2', 10]})
+        unmet = {i : objectives[i] for i in unfulfilled_indexes}  # Dictionary comprehension to create unmet dictionary, mirroring the structure of met
 
         return ObjectivesSubset(met.values(), unmet.values())  # Return just the values from the met and unmet dictionaries
     
@@ -1512,7 +1822,11 @@ class Player:
         # TODO: Figure out why this happens
         try:
           dropped = self.objectives.pop(objective_to_drop)  # Remove the objective from the current player
+          self.value_by_resource[dropped.resource] -= dropped.value
+          self.team.value_by_resource[dropped.resource] -= dropped.value
           dropped_objectives_list.append(dropped)  # Mark it
+          if self.community is not None:
+              self.community.adjustTotal(-fulfilled_value(dropped, self.team.resource_mask))
         except KeyError:
           pass
 
@@ -1525,8 +1839,14 @@ class Player:
             traded_objectives_list: Community object attribute keeping track of traded objectives
         """
         give_away = self.objectives.pop(objective_to_give)  # Remove the objective from the current player
+        self.value_by_resource[give_away.resource] -= give_away.value
+        self.team.value_by_resource[give_away.resource] -= give_away.value
         traded_objectives_list.append(give_away)  # Mark it
         receiver.objectives[objective_to_give] = give_away  # Give the objective to the receiver
+        receiver.value_by_resource[give_away.resource] += give_away.value
+        receiver.team.value_by_resource[give_away.resource] += give_away.value
+        if self.community is not None:
+            self.community.adjustTotal(fulfilled_value(give_away, receiver.team.resource_mask) - fulfilled_value(give_away, self.team.resource_mask))
     
     def joinTeam(self, team):
         """Adds a player to a different team.
@@ -1534,10 +1854,29 @@ class Player:
         Args: 
             team: Team object to join
         """
-        self.team.removePlayer(self)  # Leave current team
+        old_team = self.team
+
+        # Only the old and new teams' values can change, so the community total is adjusted by their difference
+        if self.community is not None:
+            before = old_team.totalValue() + team.totalValue()
+
+        old_team.removePlayer(self)  # Leave current team
         team.addPlayer(self)  # Join new team
         self.team = team  # Reassign new team to player attributes
+
+        if self.community is not None:
+            self.community.adjustTotal(old_team.totalValue() + team.totalValue() - before)
+            self.community.moveMembership(self, old_team, team)
+            self.community.updateTeams(old_team, team)
     
+    def lackingResources(self):
+        """Returns a bitmask of the resources the player holds objectives for but doesn't have on their team."""
+        wanted = 0
+        for resource, value in enumerate(self.value_by_resource):
+            if value:
+                wanted |= resource_bit(resource)
+        return wanted & ~self.team.resource_mask
+
     def setInitialTeam(self, team):
         """Sets a player's initial team to the team object provided."""
         self.team = team
@@ -1547,19 +1886,22 @@ class Player:
 
         For example, "I am Player 01; I have resource C; I have objectives a1, d1, a1, c1, d1; I'm on team Team 00; and my total value is 60."
         """
-        objectives = ', '.join('%s' % obj[0] for obj in self.objectives.values())  # Build a comma separated list of objectives
-        print "I am %s; I have resource %s; I have objectives %s; I'm on team %s; and my total value is %s."%(self.name, self.resource, objectives, self.team.name, self.currentTotal())
+        objectives = ', '.join('%s' % objective_name(obj.resource, obj.tier) for obj in self.objectives.values())  # Build a comma separated list of objectives
+        print "I am %s; I have resource %s; I have objectives %s; I'm on team %s; and my total value is %s."%(self.name, resource_name(self.resource), objectives, self.team.name, self.currentTotal())
 
     def best_given_objective(self, resource_pool, other_resource=None):
         """
         Determines the best objective to drop or give away.
 
         Args:
-            resource_pool: A list of resources to consider when determining which objective to get rid of (i.e. ['B', 'D', 'C'])
-            other_resource (optional): The resource of the other player when running variation 5
+            resource_pool: A bitmask of resources to consider when determining which objective to get rid of (i.e. a team's `resource_mask`)
+            other_resource (optional): The resource id of the other player when running variation 5
 
-        Returns the index of the objective to be dropped or given away.
+        Returns the index of the objective to be dropped or given away. Ties within a group of objectives go to the lowest objective index.
         """
+        if self.community is not None:
+            self.community.counters.best_given_objective += 1
+
         # Initialize dictionaries to organize objectives with.
         good = {}  # good_high and good_low contain the player's fulfilled high-value and low-value objectives 
         good_high = {}
@@ -1573,9 +1915,8 @@ class Player:
 
         # Build general good and worthless dictionaries
         for index, details in self.objectives.items():
-            for resource in resource_pool:
-                if resource == details[0][0].upper():
-                    good[index] = details
+            if resource_pool & objective_bit(details):
+                good[index] = details
 
             if index not in good:
                 worthless[index] = details
@@ -1583,33 +1924,33 @@ class Player:
         # Separate good and worthless into high and low
         if len(good) > 0:
             for index, details in good.items():
-                if int(details[0][1]) == 1:
+                if details.tier == HIGH_VALUE_TIER:
                     good_high[index] = details
                 else:
                     good_low[index] = details
 
         if len(worthless) > 0:
             for index, details in worthless.items():
-                if int(details[0][1]) == 1:
+                if details.tier == HIGH_VALUE_TIER:
                     worthless_high[index] = details
                 else:
                     worthless_low[index] = details
 
-        if other_resource:
+        if other_resource is not None:
             # Try to match an objective to the other player's resource
             # Order of selection = worthless_low -> worthless_high -> good_low. Don't potentially give up any good_high.
-            for index, details in worthless_low.items():
-                if details[0][0].upper() == other_resource:
+            for index, details in sorted(worthless_low.items()):
+                if details.resource == other_resource:
                     best_objective = index
                     break
             if not best_objective:  # If nothing was found in worthless_low, make an offer from worthless_high
-                for index, details in worthless_high.items():
-                    if details[0][0].upper() == other_resource:
+                for index, details in sorted(worthless_high.items()):
+                    if details.resource == other_resource:
                         best_objective = index
                         break
             if not best_objective:  # If nothing was found in worthless_high, make an offer from good_low
-                for index, details in good_low.items():
-                    if details[0][0].upper() == other_resource:
+                for index, details in sorted(good_low.items()):
+                    if details.resource == other_resource:
                         best_objective = index
                         break
             # If no good match was found, use the regular selection algorithm below to give away an objective that doesn't match
@@ -1618,18 +1959,284 @@ class Player:
             # Choose an objective to get rid of, starting with the worthless_low dictionary
             # Order of selection = worthless_low -> worthless_high -> good_low -> good_high
             if len(worthless_low.keys()) > 0:
-                best_objective = worthless_low.keys()[0]
+                best_objective = min(worthless_low.keys())
             elif len(worthless_high.keys()) > 0:
-                best_objective = worthless_high.keys()[0]
+                best_objective = min(worthless_high.keys())
             elif len(good_low.keys()) > 0:
-                best_objective = good_low.keys()[0]
+                best_objective = min(good_low.keys())
             elif len(good_high.keys()) > 0:
-                best_objective = good_high.keys()[0]
+                best_objective = min(good_high.keys())
 
         return best_objective  # Return the key or index of the objective
 
 
+class PlayerStore:
+    """Struct-of-arrays storage for very large populations of players.
+
+    Instead of each player holding its own attributes, dictionary of objectives, and list of values, the whole population is kept in flat `array` buffers indexed by player number. StoredPlayer objects are small views into the store with the same API as Player, so the rest of the simulation works unchanged.
+
+    Each player's objectives are a linked list through the objective arrays (`first_objective` points to a player's first objective index and `objective_next` to the next one), so dropping and giving objectives away doesn't allocate anything.
+
+    Attributes:
+        num_players: The number of players in the store
+        num_resources: The number of resource types in the simulation
+        resources: Resource id of each player
+        teams: Team index of each player (-1 until the player is assigned to a team)
+        values: Objective values by resource for every player, `num_resources` entries per player (i.e. player 3's value for resource 2 is at 3 * num_resources + 2)
+        first_objective: Index of each player's first objective (-1 if the player has no objectives)
+        objective_resources, objective_tiers, objective_values: Resource id, value tier, and value of every objective in the objective pool
+        objective_owners: Player number holding each objective (-1 if the objective has been dropped)
+        objective_next: Index of the next objective held by the same player (-1 at the end of the list)
+        team_objects: A dictionary of the team objects players belong to, keyed by team index
+        community: The Community object the players belong to
+
+    Returns:
+        A new player store object
+    """
+    def __init__(self, num_players, num_resources, objectives_table):
+        """Creates empty storage for a population of players.
+
+        Args:
+            num_players: The number of players in the simulation
+            num_resources: The number of resource types in the simulation
+            objectives_table: List of Objective named tuples in an ObjectivePool() object (e.g. [Objective(resource=0, tier=1, value=20),...])
+        """
+        num_objs = len(objectives_table)
+        self.num_players = num_players
+        self.num_resources = num_resources
+
+        # Player arrays
+        self.resources = array('i', [0]) * num_players
+        self.teams = array('i', [-1]) * num_players
+        self.values = array('l', [0]) * (num_players * num_resources)
+        self.first_objective = array('i', [-1]) * num_players
+
+        # Objective arrays
+        self.objective_resources = array('i', [objective.resource for objective in objectives_table])
+        self.objective_tiers = array('i', [objective.tier for objective in objectives_table])
+        self.objective_values = array('i', [objective.value for objective in objectives_table])
+        self.objective_owners = array('i', [-1]) * num_objs
+        self.objective_next = array('i', [-1]) * num_objs
+
+        self.team_objects = {}
+        self.community = None
+
+    def objective(self, index):
+        """Returns the Objective named tuple for an objective index."""
+        return Objective(self.objective_resources[index], self.objective_tiers[index], self.objective_values[index])
+
+    def owns(self, number, index):
+        """Returns true if the player with the given number holds the objective index."""
+        return index is not None and 0 <= index < len(self.objective_owners) and self.objective_owners[index] == number
+
+    def attachObjective(self, number, index):
+        """Gives an objective index to a player by adding it to the front of the player's list of objectives."""
+        self.objective_owners[index] = number
+        self.objective_next[index] = self.first_objective[number]
+        self.first_objective[number] = index
+
+    def detachObjective(self, number, index):
+        """Takes an objective index away from a player by removing it from the player's list of objectives."""
+        previous = -1
+        current = self.first_objective[number]
+        while current != index:
+            previous = current
+            current = self.objective_next[current]
+        if previous == -1:
+            self.first_objective[number] = self.objective_next[index]
+        else:
+            self.objective_next[previous] = self.objective_next[index]
+        self.objective_owners[index] = -1
+        self.objective_next[index] = -1
+
+    def bytesPerPlayer(self, players=None):
+        """Returns the average memory used per player by the store's arrays (and, optionally, by a list of StoredPlayer views)."""
+        buffers = [self.resources, self.teams, self.values, self.first_objective, 
+            self.objective_resources, self.objective_tiers, self.objective_values, self.objective_owners, self.objective_next]
+        total = sum(buffer.itemsize * len(buffer) for buffer in buffers)
+        if players is not None:
+            total += sum(getsizeof(player) for player in players)
+        return total / float(self.num_players)
+
+
+class StoredPlayer(Player, object):
+    """A player whose attributes live in a PlayerStore instead of on the object itself.
+
+    The view only keeps a reference to the store and its player number; resource, team, community, objectives, and value_by_resource are read from and written to the store's arrays, so every Player method works on it unchanged.
+
+    Returns:
+        A new stored player object
+    """
+    __slots__ = ('store', 'number')
+
+    def __init__(self, store, number, resource, objective_indices):
+        """Creates a new player in a PlayerStore.
+
+        Args:
+            store: A PlayerStore object
+            number: The player's number (its position in the store's arrays)
+            resource: The id of a resource (i.e. 0 for "A")
+            objective_indices: A list of objective indices (i.e. [1, 2, 3, 4, 5])
+        """
+        self.store = store
+        self.number = number
+        store.resources[number] = resource
+        for i in objective_indices:
+            store.attachObjective(number, i)
+            store.values[number * store.num_resources + store.objective_resources[i]] += store.objective_values[i]
+
+    @property
+    def name(self):
+        return "Player %02d" % self.number
+
+    @property
+    def resource(self):
+        return self.store.resources[self.number]
+
+    @property
+    def resource_bit(self):
+        return 1 << self.store.resources[self.number]
+
+    @property
+    def objectives(self):
+        return StoredObjectives(self.store, self.number)
+
+    @property
+    def value_by_resource(self):
+        return StoredValues(self.store.values, self.number * self.store.num_resources, self.store.num_resources)
+
+    @property
+    def team(self):
+        return self.store.team_objects[self.store.teams[self.number]]
+
+    @team.setter
+    def team(self, team):
+        self.store.team_objects[team.index] = team
+        self.store.teams[self.number] = team.index
+
+    @property
+    def community(self):
+        return self.store.community
+
+    @community.setter
+    def community(self, community):
+        self.store.community = community
+
+
+class StoredObjectives(object):
+    """A dictionary-like view of the objectives a StoredPlayer holds, keyed by objective index (i.e. {5: Objective(resource=0, tier=1, value=20), ...})."""
+    __slots__ = ('store', 'number')
+
+    def __init__(self, store, number):
+        self.store = store
+        self.number = number
+
+    def __iter__(self):
+        index = self.store.first_objective[self.number]
+        while index != -1:
+            yield index
+            index = self.store.objective_next[index]
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, index):
+        return self.store.owns(self.number, index)
+
+    def __getitem__(self, index):
+        if not self.store.owns(self.number, index):
+            raise KeyError(index)
+        return self.store.objective(index)
+
+    def __setitem__(self, index, objective):
+        """Gives the objective index to the player. The objective itself always comes from the store's objective arrays."""
+        if not self.store.owns(self.number, index):
+            if self.store.objective_owners[index] != -1:
+                self.store.detachObjective(self.store.objective_owners[index], index)
+            self.store.attachObjective(self.number, index)
+
+    def pop(self, index):
+        if not self.store.owns(self.number, index):
+            raise KeyError(index)
+        self.store.detachObjective(self.number, index)
+        return self.store.objective(index)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self.store.objective(index) for index in self]
+
+    def items(self):
+        return [(index, self.store.objective(index)) for index in self]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class StoredValues(object):
+    """A list-like view of one player's slice of PlayerStore.values (its objective values by resource id)."""
+    __slots__ = ('values', 'start', 'length')
+
+    def __init__(self, values, start, length):
+        self.values = values
+        self.start = start
+        self.length = length
+
+    def __getitem__(self, resource):
+        return self.values[self.start + resource]
+
+    def __setitem__(self, resource, value):
+        self.values[self.start + resource] = value
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.values[self.start:self.start + self.length])
+
+
 # Important mini functions
+def allocate(num_players, num_resources, num_objs_per_player,
+    approximate_high_low_resource_ratio, approximate_high_low_objective_ratio,
+    value_high, value_low, allocation_seed=None):
+    """Builds the resource and objective pools and shuffles the players and objectives that CollaborationModel deals out to the players.
+
+    The pools don't use any random numbers, so they're only built once for each set of parameters and kept in `pool_cache`; every allocation with those parameters shares them (read-only). Only the shuffles are new each time. Without `allocation_seed`, they use the random module, exactly like a CollaborationModel built without an allocation. With it, they use their own Random(allocation_seed), so the same seed always gives the same allocation. Nothing keeps the allocations themselves; a caller that reuses them (like the runner's replicate_allocation()) holds on to them for as long as it needs them.
+
+    Returns an Allocation named tuple with attributes resource_pool, objective_pool, players_list, and objs_index.
+    """
+    key = (num_players, num_resources, num_objs_per_player, approximate_high_low_resource_ratio,
+        approximate_high_low_objective_ratio, value_high, value_low)
+    if key not in pool_cache:
+        resource_pool = ResourcePool(num_resources, num_players, approximate_high_low_resource_ratio)
+        objective_pool = ObjectivePool(resource_pool, num_players, num_objs_per_player, approximate_high_low_objective_ratio, value_high, value_low)
+        pool_cache[key] = (resource_pool, objective_pool)
+    resource_pool, objective_pool = pool_cache[key]
+
+    players_list = range(num_players)
+    objs_index = range(objective_pool.num_objs)
+    shuffle_list = shuffle if allocation_seed is None else Random(allocation_seed).shuffle
+    shuffle_list(players_list)
+    shuffle_list(objs_index)
+
+    return Allocation(resource_pool, objective_pool, players_list, objs_index)
+
+def export_columns(resources_list):
+    """Returns the column names of an exported row (see CollaborationModel.export()) for a list of resources like ResourcePool.resources_list.
+
+    The names only depend on the resources, so they're built once for each list and kept in `export_column_cache`.
+    """
+    key = tuple(resources_list)
+    if key not in export_column_cache:
+        columns = list(EXPORT_COLUMNS)
+        for resource, frequency in resources_list:
+            for tier in (HIGH_VALUE_TIER, LOW_VALUE_TIER):
+                columns.extend("{0}_{1}".format(objective_name(resource, tier), column) for column in OBJECTIVE_COLUMNS)
+        columns.extend(name for name, count in RunCounters().columns())
+        export_column_cache[key] = columns
+    return export_column_cache[key]
+
 def pairs(lst):
     i = iter(lst)
     first = prev = i.next()
@@ -1638,6 +2245,82 @@ def pairs(lst):
         prev = item
     yield item, first
 
+# Objectives are integer-coded: the id of the resource that fulfills them, a value tier, and the value itself
+# (i.e. Objective(resource=2, tier=2, value=10) is "c2"). Names are only built for exporting.
+Objective = namedtuple('Objective', 'resource, tier, value')
+HIGH_VALUE_TIER = 1
+LOW_VALUE_TIER = 2
+
+# Named tuples returned by ResourcePool.divide_high_low(), Community.teamStats(), Community.individualStats(), and Community/Player.objectivesSubset()
+DividedResources = namedtuple('Resources', ['high', 'low'])
+TeamStatistics = namedtuple('TeamStatistics', 'number, min, max, mean, median')
+IndividualStatistics = namedtuple('IndividualStatistics', 'min, max, mean, median')
+ObjectivesSubset = namedtuple('ObjectivesSubset', 'fulfilled, unfulfilled')
+
+# Columns of an exported row (see CollaborationModel.export()) before the resource-specific ones
+EXPORT_COLUMNS = ('id', 'variation', 'player_count', 'community_motivation', 'encounters', 'switches', 'switch_ratio', 'cycle_length',
+    'number_of_teams', 'team_size_min', 'team_size_max', 'team_size_mean', 'team_size_median',
+    'indiv_total_min_before', 'indiv_total_max_before', 'indiv_total_mean_before', 'indiv_total_median_before',
+    'indiv_total_min_after', 'indiv_total_max_after', 'indiv_total_mean_after', 'indiv_total_median_after',
+    'indiv_delta_mean', 'indiv_delta_median',
+    'social_value_before', 'social_value_after', 'potential_social_value', 'unmet_social_value', 'percent_social_value_met',
+    'num_resources', 'num_objectives', 'objs_fulfilled', 'objs_held_unfulfilled', 'objs_dropped', 'objs_traded',
+    'objs_fulfilled_ratio', 'objs_unfulfilled_ratio')
+
+# Columns for each objective (i.e. a1_value, a1_count, ...), exported for every resource and tier after EXPORT_COLUMNS, followed by the RunCounters columns
+OBJECTIVE_COLUMNS = ('value', 'count', 'high_freq', 'trades', 'dropped', 'fulfilled', 'pct_fulfilled', 'held_unfulfilled')
+
+# Column names made by export_columns(), keyed by resources list
+export_column_cache = {}
+
+# A starting allocation of resources and objectives (see allocate()): the pools, and the shuffled players and objective indices dealt out by CollaborationModel
+Allocation = namedtuple('Allocation', 'resource_pool, objective_pool, players_list, objs_index')
+
+# Resource and objective pools made by allocate(), keyed by their parameters (one entry for each set of parameters, however many allocations share it)
+pool_cache = {}
+
+# Seed for the keys behind Community.membership_hash. Any seed works; the keys only need to be random and fixed.
+MEMBERSHIP_HASH_SEED = 0
+
+# Parts of a simulation that are timed when a CollaborationModel is built with `timings=True`, in the order they happen
+PHASES = ('construction', 'pairing', 'decisions', 'stability', 'export')
+
+def resource_bit(resource):
+    """Returns the bit for a resource id in a resource mask (i.e. 4 for resource 2, or "C"). Pools of resources are stored and combined as integers; a team with A and C has a resource mask of 5."""
+    return 1 << resource
+
+def objective_bit(objective):
+    """Returns the bit for the resource that fulfills an Objective (i.e. 4 for "c2")."""
+    return 1 << objective.resource
+
+def fulfilled_value(details, mask):
+    """Returns the value of a single Objective if a resource in the resource mask fulfills it, otherwise 0."""
+    if mask & (1 << details.resource):
+        return details.value
+    return 0
+
+def resource_name(resource):
+    """Returns the name of a resource id: A through Z, then AA, AB, etc. (i.e. "C" for 2, "AA" for 26)."""
+    name = ''
+    resource += 1
+    while resource:
+        resource, remainder = divmod(resource - 1, len(ascii_uppercase))
+        name = ascii_uppercase[remainder] + name
+    return name
+
+def objective_name(resource, tier):
+    """Returns the name of an objective from its resource id and value tier (i.e. "c2" for resource 2 and LOW_VALUE_TIER)."""
+    return resource_name(resource).lower() + str(tier)
+
+def masked_sum(values, mask):
+    """Sum the values (indexed by resource position) of every resource in a resource mask. Only the set bits are visited."""
+    total = 0
+    while mask:
+        lowest = mask & -mask
+        total += values[lowest.bit_length() - 1]
+        mask ^= lowest
+    return total
+
 def uniquify(seq):
     """Take a list and return only the unique values in that list. Does not preserve list order."""
     seen = set()
@@ -1678,5 +2361,5 @@ def printObjectivesPool():
     print '----- Objective pool -----'
     count = 0
     for row in objs_table:
-        print "%02d"%count, row['name'], row['value']
+        print "%02d"%count, objective_name(row.resource, row.tier), row.value
         count += 1
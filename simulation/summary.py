@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+#
+# Streaming summaries of simulation results
+#-------------------------------------------
+# Table 4 only needs the mean and standard deviation of a handful of columns
+# for each variation and motivation. These classes keep running moments as
+# rows arrive, so the summary doesn't need every row in memory or on disk.
+#
+
+from math import sqrt
+import csv
+
+
+def summary_columns(header):
+    """Returns the columns worth summarizing: the objective fulfillment rates and social values used in Table 4, plus the resource count, objective counts, and resource frequencies it uses to label each row.
+
+    The objective columns are found through their `_pct_fulfilled` column (a1_pct_fulfilled, ...), so other columns that happen to end the same way (like player_count) are left out.
+    """
+    objectives = [name[:-len('_pct_fulfilled')] for name in header if name.endswith('_pct_fulfilled')]
+    objective_columns = set(objective + suffix for objective in objectives for suffix in ('_pct_fulfilled', '_count', '_high_freq'))
+    return [name for name in header
+        if name in objective_columns
+        or name.startswith('social_value_') or name in ('potential_social_value', 'unmet_social_value', 'percent_social_value_met', 'num_resources')]
+
+
+class RunningStats:
+    """Running count, mean, and variance of a stream of numbers, updated with Welford's algorithm.
+
+    Attributes:
+        count: The number of values seen
+        mean: The mean of the values seen
+        m2: The sum of squared differences from the current mean
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def sd(self):
+        """Returns the sample standard deviation (n - 1 in the denominator, like R's sd()), or 0 with fewer than two values."""
+        if self.count < 2:
+            return 0.0
+        return sqrt(self.m2 / (self.count - 1))
+
+
+class SummaryAggregator:
+    """Keeps RunningStats for every summary column in every variation and motivation cell.
+
+    Attributes:
+        header: The full list of result column names
+        columns: The names of the summarized columns
+        stats: A dictionary of lists of RunningStats (in `columns` order), keyed by (variation, community_motivation)
+    """
+    def __init__(self, header):
+        self.header = list(header)
+        self.columns = summary_columns(self.header)
+        self.positions = [self.header.index(name) for name in self.columns]
+        self.variation_position = self.header.index('variation')
+        self.motivation_position = self.header.index('community_motivation')
+        self.stats = {}
+
+    def writerow(self, row):
+        """Adds one result row. Takes the same rows as a csv.writer, so it can sit next to (or replace) the CSV file."""
+        cell = (int(row[self.variation_position]), int(row[self.motivation_position]))
+        if cell not in self.stats:
+            self.stats[cell] = [RunningStats() for name in self.columns]
+
+        for stat, position in zip(self.stats[cell], self.positions):
+            stat.add(float(row[position]))
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write(self, filename):
+        """Writes one row per variation and motivation with the number of runs and the mean and sd of every summary column (a1_pct_fulfilled_mean, a1_pct_fulfilled_sd, ...)."""
+        with open(filename, 'wb') as csv_file:
+            csv_out = csv.writer(csv_file, delimiter=',', quoting=csv.QUOTE_ALL)
+
+            header = ['variation', 'community_motivation', 'runs']
+            for name in self.columns:
+                header += [name + '_mean', name + '_sd']
+            csv_out.writerow(header)
+
+            for cell in sorted(self.stats):
+                stats = self.stats[cell]
+                row = [cell[0], cell[1], stats[0].count]
+                for stat in stats:
+                    row += [stat.mean, stat.sd()]
+                csv_out.writerow(row)